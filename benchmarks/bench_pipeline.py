@@ -0,0 +1,482 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+生成流程和匹配引擎的基准测试
+
+按指定规模（默认 10k、100k、1M 条）生成标签分布接近真实列表的合成域名语料，分别计时：
+- read_domain_file：读取 config 格式的域名文件
+- download_domain_list：从本地 HTTP 服务器流式下载并解析 Clash 格式列表
+- check_duplicate_domains：自定义直连域名与中国域名列表去重
+- format_domain_lists_for_pac：flat 和 trie 两种编码
+- 域名集合的两种表示：set 与 DomainIndex 的内存占用（tracemalloc）、并集和查找耗时
+- generate_pac：端到端生成（下载、合并、精简、渲染、写入）
+- 单个 host 的查找耗时：原模板的线性扫描（endsWith）与当前的逐级标签查表
+- 安装了 node 时，额外计时生成的 PAC 中 FindProxyForURL 的实际耗时
+
+查找类项目耗时很短，按 LOOKUP_REPEAT 轮计时取中位数。结果保存为 JSON，可以与保存的基线比较，
+超过阈值且绝对差值超过噪声下限的变慢项视为性能回退并以状态码 1 退出。
+
+使用方法:
+    python3 benchmarks/bench_pipeline.py [--sizes 10k,100k,1m] [--output FILE] [--baseline FILE] [--threshold 0.25]
+"""
+
+import contextlib
+import functools
+import io
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from datetime import datetime
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+import build_metrics
+import generate_pac
+import pac_engine
+from domain_index import DomainIndex
+
+SIZES = {"10k": 10_000, "100k": 100_000, "1m": 1_000_000}
+DEFAULT_SIZES = ["10k", "100k", "1m"]
+THRESHOLD = 0.25  # 比基线慢超过该比例视为回退
+MIN_SECONDS = 0.005  # 基线耗时低于该值的项目计时误差过大，不参与比较
+MIN_DELTA_SECONDS = 0.002  # 比基线慢不超过该值时视为计时噪声
+MIN_LOOKUP_DELTA = 0.2e-6  # 查找类项目（每个 host 的秒数）的噪声下限
+MIN_MEMORY_DELTA_KB = 16  # memory_ 项目（KB）的噪声下限，tracemalloc 的结果几乎没有波动
+LOOKUP_REPEAT = 15  # 查找类项目的计时轮数，取中位数
+NODE_WARMUP = 3  # node 计时前的预热轮数，等待 JIT 编译完成
+NODE_LOOKUP_PASSES = 5  # node 每轮计时遍历 host 列表的次数，避免单轮耗时过短
+LOOKUP_HOSTS = 2000  # 标签查表使用的 host 数量
+LINEAR_LOOKUP_HOSTS = 50  # 线性扫描很慢，只使用少量 host
+SEED = 20240601
+REFERENCE_ITEMS = {"lookup_linear_scan"}  # 只作为对照的项目（原模板的匹配方式），不参与回退判断
+
+# 顶级域名及权重，大致参考中国域名列表中的分布
+TLD_WEIGHTS = [
+    ("com", 46), ("cn", 18), ("net", 9), ("com.cn", 6), ("org", 3), ("io", 2), ("top", 2),
+    ("xyz", 1), ("cc", 2), ("tv", 1), ("me", 1), ("info", 1), ("net.cn", 1), ("ltd", 1),
+    ("vip", 1), ("co", 1), ("gov.cn", 1), ("edu.cn", 1), ("link", 1), ("site", 1)
+]
+# 常见子域名前缀
+SUBDOMAIN_LABELS = ["www", "api", "m", "cdn", "img", "static", "mail", "news", "v", "pay", "s", "dl", "app", "open", "passport"]
+# 子域名层数的分布: 0 层（注册域名本身）最多
+DEPTH_WEIGHTS = [(0, 55), (1, 30), (2, 11), (3, 4)]
+LETTERS = "abcdefghijklmnopqrstuvwxyz"
+LABEL_CHARS = LETTERS + "0123456789-"
+
+def weighted_choice(rng, weighted):
+    values = [value for value, _ in weighted]
+    weights = [weight for _, weight in weighted]
+    return rng.choices(values, weights)[0]
+
+def random_label(rng):
+    """生成长度 3-15 的标签，短标签更常见，首尾不是连字符"""
+    length = min(3 + int(rng.expovariate(1 / 5)), 15)
+    middle = "".join(rng.choice(LABEL_CHARS) for _ in range(length - 2))
+    return rng.choice(LETTERS) + middle + rng.choice(LETTERS)
+
+def random_domain(rng):
+    labels = [random_label(rng), weighted_choice(rng, TLD_WEIGHTS)]
+    for _ in range(weighted_choice(rng, DEPTH_WEIGHTS)):
+        labels.insert(0, rng.choice(SUBDOMAIN_LABELS) if rng.random() < 0.7 else random_label(rng))
+    return ".".join(labels)
+
+def build_corpus(size, seed=SEED):
+    """生成 size 条规则: 约 60% 为后缀规则，其余为全字匹配，另有少量 IP 段，返回 {"suffixes", "domains", "cidrs"}"""
+    rng = random.Random(seed + size)
+    corpus = {key: set() for key in generate_pac.RULE_KEYS}
+    while len(corpus["suffixes"]) + len(corpus["domains"]) < size:
+        domain = random_domain(rng)
+        kind = "suffixes" if rng.random() < 0.6 else "domains"
+        corpus[kind].add(domain)
+    for _ in range(max(size // 1000, 1)):
+        corpus["cidrs"].add(f"{rng.randrange(1, 224)}.{rng.randrange(256)}.{rng.randrange(256)}.0/24")
+    return corpus
+
+def write_clash_list(corpus, filename):
+    """写入 Clash 规则列表格式（DOMAIN-SUFFIX / DOMAIN / IP-CIDR），与上游列表一致"""
+    with open(filename, "w", encoding="utf-8") as f:
+        f.write("# synthetic benchmark corpus\n")
+        for domain in sorted(corpus["suffixes"]):
+            f.write(f"DOMAIN-SUFFIX,{domain}\n")
+        for domain in sorted(corpus["domains"]):
+            f.write(f"DOMAIN,{domain}\n")
+        for cidr in sorted(corpus["cidrs"]):
+            f.write(f"IP-CIDR,{cidr},no-resolve\n")
+
+def write_config_file(corpus, filename):
+    """写入 config/direct.txt 格式（.example.com 为后缀，example.com 为全字匹配）"""
+    with open(filename, "w", encoding="utf-8") as f:
+        for domain in sorted(corpus["suffixes"]):
+            f.write(f".{domain}\n")
+        for domain in sorted(corpus["domains"]):
+            f.write(f"{domain}\n")
+
+def build_custom_rules(corpus, rng):
+    """生成自定义直连规则：约一半与语料重复（含子域名），其余为新域名，数量为语料的 1%"""
+    count = max(len(corpus["suffixes"]) // 100, 10)
+    suffixes = list(corpus["suffixes"])
+    custom = {key: set() for key in generate_pac.RULE_KEYS}
+    for _ in range(count):
+        if rng.random() < 0.5:
+            base = rng.choice(suffixes)
+            custom["domains" if rng.random() < 0.5 else "suffixes"].add(f"{rng.choice(SUBDOMAIN_LABELS)}.{base}")
+        else:
+            custom["suffixes"].add(random_domain(rng))
+    return custom
+
+def build_lookup_hosts(corpus, count, rng):
+    """生成查找用的 host：一半命中（后缀规则的子域名或全字匹配域名），一半不命中"""
+    suffixes = list(corpus["suffixes"])
+    domains = list(corpus["domains"])
+    hosts = []
+    for i in range(count):
+        if i % 2 == 0:
+            if rng.random() < 0.7:
+                hosts.append(f"{rng.choice(SUBDOMAIN_LABELS)}.{rng.choice(suffixes)}")
+            else:
+                hosts.append(rng.choice(domains))
+        else:
+            hosts.append(f"{rng.choice(SUBDOMAIN_LABELS)}.{random_label(rng)}.example")
+    return hosts
+
+def linear_match(host, suffix_list, domain_list):
+    """原 pac-template 的匹配方式：逐条比较后缀列表（endsWith）和全字匹配列表"""
+    for pattern in suffix_list:
+        if host == pattern or host.endswith("." + pattern):
+            return True
+    for pattern in domain_list:
+        if host == pattern:
+            return True
+    return False
+
+def label_walk_match(host, suffixes, domains):
+    """当前 pac-template 的匹配方式：从右向左逐级取后缀查表"""
+    return pac_engine.domain_suffix_match(host, suffixes) or host in domains
+
+def index_match(host, suffixes, domains):
+    """DomainIndex 的匹配方式：逐级取后缀二分查找"""
+    return suffixes.covering_suffix(host) is not None or host in domains
+
+def traced_memory(build):
+    """用 tracemalloc 统计 build() 构建的对象在构建完成后仍占用的内存和构建过程中的峰值（KB）"""
+    tracemalloc.start()
+    result = build()
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return retained / 1024, peak / 1024
+
+def best_time(func, repeat):
+    """执行 func repeat 次，返回最短耗时（秒）和最后一次的返回值"""
+    best = None
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+def median_time(func, repeat):
+    """执行 func repeat 次，返回耗时的中位数（秒）和最后一次的返回值"""
+    timings = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings), result
+
+@contextlib.contextmanager
+def quiet():
+    """屏蔽被测函数的输出"""
+    with contextlib.redirect_stdout(io.StringIO()):
+        yield
+
+class QuietHandler(SimpleHTTPRequestHandler):
+    """不输出访问日志的静态文件处理器"""
+    def log_message(self, format, *args):
+        pass
+
+@contextlib.contextmanager
+def file_server(directory):
+    """在后台线程中启动提供 directory 的本地 HTTP 服务器，返回基础 URL"""
+    server = ThreadingHTTPServer(("127.0.0.1", 0), functools.partial(QuietHandler, directory=directory))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield f"http://127.0.0.1:{server.server_address[1]}"
+    finally:
+        server.shutdown()
+        server.server_close()
+
+@contextlib.contextmanager
+def isolated_build(work_dir, sources):
+    """在 work_dir 中运行 generate_pac，sources 为 {来源名: URL}，结束后恢复模块配置和工作目录"""
+    saved = {
+        "cwd": os.getcwd(),
+        "sources": dict(generate_pac.DOMAIN_SOURCES),
+        "template": generate_pac.PAC_TEMPLATE
+    }
+    generate_pac.PAC_TEMPLATE = os.path.join(ROOT_DIR, saved["template"])
+    for name, url in sources.items():
+        generate_pac.DOMAIN_SOURCES[name] = (url, saved["sources"][name][1])
+    os.chdir(work_dir)
+    try:
+        yield
+    finally:
+        os.chdir(saved["cwd"])
+        generate_pac.DOMAIN_SOURCES.clear()
+        generate_pac.DOMAIN_SOURCES.update(saved["sources"])
+        generate_pac.PAC_TEMPLATE = saved["template"]
+
+def time_node_lookup(pac_file, hosts, repeat):
+    """
+    用 node 计时生成的 PAC 中 FindProxyForURL 遍历一次 hosts 的耗时（关闭判定缓存），未安装 node 时返回 None
+    预热 NODE_WARMUP 轮后计时 repeat 轮，每轮遍历 NODE_LOOKUP_PASSES 次，返回各轮平均到一次遍历的耗时中位数
+    """
+    node = shutil.which("node")
+    if not node:
+        return None
+    script = """
+const fs = require("fs");
+const source = fs.readFileSync(process.argv[1], "utf8").replace(/decisionCacheSize = \\d+/, "decisionCacheSize = 0");
+const find = new Function(source + "; return FindProxyForURL;")();
+const hosts = JSON.parse(fs.readFileSync(process.argv[2], "utf8"));
+const [warmup, repeat, passes] = process.argv.slice(3).map(Number);
+const timings = [];
+for (let r = 0; r < warmup + repeat; r++) {
+    const start = process.hrtime.bigint();
+    for (let p = 0; p < passes; p++) {
+        for (const host of hosts) find("https://" + host + "/", host);
+    }
+    if (r >= warmup) timings.push(Number(process.hrtime.bigint() - start) / 1e9 / passes);
+}
+console.log(JSON.stringify(timings));
+"""
+    hosts_file = pac_file + ".hosts.json"
+    with open(hosts_file, "w", encoding="utf-8") as f:
+        json.dump(hosts, f)
+    args = [str(NODE_WARMUP), str(repeat), str(NODE_LOOKUP_PASSES)]
+    result = subprocess.run([node, "-e", script, pac_file, hosts_file] + args, capture_output=True, text=True)
+    if result.returncode != 0:
+        print(f"node 计时失败: {result.stderr.strip()}")
+        return None
+    return statistics.median(json.loads(result.stdout))
+
+def run_size(label, size, repeat, work_root):
+    """对一个规模运行所有基准，返回 {项目: 秒}，查找类项目为每个 host 的平均秒数（各轮中位数），memory_ 项目为 KB"""
+    rng = random.Random(SEED)
+    print(f"\n[{label}] 生成 {size} 条合成规则...")
+    corpus = build_corpus(size)
+    custom = build_custom_rules(corpus, rng)
+    work_dir = os.path.join(work_root, label)
+    data_dir = os.path.join(work_dir, "data")
+    config_dir = os.path.join(work_dir, generate_pac.CONFIG_DIR)
+    for directory in (data_dir, config_dir):
+        os.makedirs(directory, exist_ok=True)
+    clash_file = os.path.join(data_dir, "cn.list")
+    config_file = os.path.join(data_dir, "direct.txt")
+    write_clash_list(corpus, clash_file)
+    write_config_file(corpus, config_file)
+    write_config_file(custom, os.path.join(config_dir, "direct.txt"))
+    write_config_file(generate_pac.empty_rules(), os.path.join(config_dir, "proxy.txt"))
+    with open(os.path.join(data_dir, "lan.list"), "w", encoding="utf-8") as f:
+        f.write("DOMAIN-SUFFIX,local\nIP-CIDR,192.168.0.0/16,no-resolve\n")
+
+    results = {}
+    # 大规模语料重复多次过于耗时
+    repeat = repeat if size < 1_000_000 else 1
+
+    results["read_domain_file"], _ = best_time(lambda: generate_pac.read_domain_file(config_file), repeat)
+
+    with file_server(data_dir) as base_url:
+        with quiet():
+            results["download_parse"], parsed = best_time(
+                lambda: generate_pac.download_domain_list(f"{base_url}/cn.list", desc="基准语料", cache_dir=None), repeat
+            )
+        if generate_pac.rule_counts(parsed) != generate_pac.rule_counts(corpus):
+            raise RuntimeError(f"解析结果与语料不一致: {generate_pac.rule_counts(parsed)}")
+
+        # 与生成流程一致，使用解析后的紧凑表示
+        rules = generate_pac.compact_rules(corpus)
+        custom_rules = generate_pac.compact_rules(custom)
+        results["check_duplicate_domains"], _ = best_time(lambda: generate_pac.check_duplicate_domains(rules, custom_rules), repeat)
+        results["format_flat"], _ = best_time(lambda: generate_pac.format_domain_lists_for_pac(rules), repeat)
+        results["format_trie"], _ = best_time(lambda: generate_pac.format_domain_lists_for_pac(rules, encoding="trie"), repeat)
+        results["minimize_domain_rules"], _ = best_time(lambda: generate_pac.minimize_domain_rules(rules, custom_rules), repeat)
+
+        sources = {"localarea": f"{base_url}/lan.list", "metacubex": f"{base_url}/cn.list"}
+        with isolated_build(work_dir, sources), quiet():
+            results["generate_pac"], ok = best_time(
+                lambda: generate_pac.generate_pac(output_name="bench.pac", cache_dir=None, force=True), repeat
+            )
+        if not ok:
+            raise RuntimeError("generate_pac 失败")
+
+    # 两种域名集合表示：与解析时相同，从逐行读取的文本构建，不计入完整的输入列表；
+    # set 需要保留所有字符串，DomainIndex 只保留拼接后的字节，但构建期间要暂存所有键再排序
+    text = "\n".join(corpus["suffixes"])
+    lines = lambda: (line.rstrip("\n") for line in io.StringIO(text))
+    results["memory_set_kb"], results["memory_set_peak_kb"] = traced_memory(lambda: set(lines()))
+    results["memory_index_kb"], results["memory_index_peak_kb"] = traced_memory(lambda: DomainIndex(lines()))
+    del text
+    results["build_set"], _ = best_time(lambda: set(corpus["suffixes"]), repeat)
+    results["build_index"], suffix_index = best_time(lambda: DomainIndex(corpus["suffixes"]), repeat)
+    domain_index = DomainIndex(corpus["domains"])
+    custom_index = DomainIndex(custom["suffixes"])
+    results["union_set"], _ = best_time(lambda: set().union(corpus["suffixes"], corpus["domains"], custom["suffixes"]), repeat)
+    results["union_index"], _ = best_time(lambda: suffix_index.union(domain_index, custom_index), repeat)
+
+    lookup_hosts = build_lookup_hosts(corpus, LOOKUP_HOSTS, rng)
+    suffixes = frozenset(corpus["suffixes"])
+    domains = frozenset(corpus["domains"])
+    # 单轮查找只需几毫秒，不受 1m 规模的重复次数限制
+    lookup_repeat = max(repeat, LOOKUP_REPEAT)
+    elapsed, hits = median_time(lambda: sum(label_walk_match(host, suffixes, domains) for host in lookup_hosts), lookup_repeat)
+    results["lookup_label_walk"] = elapsed / len(lookup_hosts)
+    elapsed, index_hits = median_time(lambda: sum(index_match(host, suffix_index, domain_index) for host in lookup_hosts), lookup_repeat)
+    results["lookup_index"] = elapsed / len(lookup_hosts)
+    if index_hits != hits:
+        raise RuntimeError("DomainIndex 与哈希查表的匹配结果不一致")
+
+    linear_hosts = lookup_hosts[:LINEAR_LOOKUP_HOSTS]
+    suffix_list = sorted(corpus["suffixes"])
+    domain_list = sorted(corpus["domains"])
+    elapsed, linear_hits = best_time(lambda: sum(linear_match(host, suffix_list, domain_list) for host in linear_hosts), 1)
+    results["lookup_linear_scan"] = elapsed / len(linear_hosts)
+    if linear_hits != sum(label_walk_match(host, suffixes, domains) for host in linear_hosts):
+        raise RuntimeError("线性扫描与逐级查表的匹配结果不一致")
+
+    node_elapsed = time_node_lookup(os.path.join(work_dir, generate_pac.OUTPUT_DIR, "bench.pac"), lookup_hosts, lookup_repeat)
+    if node_elapsed is not None:
+        results["lookup_pac_js"] = node_elapsed / len(lookup_hosts)
+
+    for name, seconds in results.items():
+        if name.startswith("lookup_"):
+            unit = f"{seconds * 1e6:.2f} 微秒/host"
+        elif name.startswith("memory_"):
+            unit = f"{seconds:.0f} KB"
+        else:
+            unit = f"{seconds:.4f} 秒"
+        print(f"[{label}] {name}: {unit}")
+    print(f"[{label}] 查表命中率: {hits / len(lookup_hosts):.1%}, "
+          f"线性扫描 / 逐级查表: {results['lookup_linear_scan'] / max(results['lookup_label_walk'], 1e-12):.0f} 倍, "
+          f"DomainIndex / set 内存: {results['memory_index_kb'] / max(results['memory_set_kb'], 1e-12):.0%}")
+    return results
+
+def compare_with_baseline(results, baseline, threshold=THRESHOLD):
+    """
+    与基线比较，返回回退项列表 [(规模, 项目, 基线值, 当前值)]，memory_ 项目的值为 KB，其余为秒
+    比基线大超过 threshold 且差值超过噪声下限（查找类项目为 MIN_LOOKUP_DELTA，memory_ 项目为 MIN_MEMORY_DELTA_KB，
+    其余为 MIN_DELTA_SECONDS）时视为回退
+    """
+    regressions = []
+    for label, items in results.items():
+        for name, seconds in items.items():
+            base = baseline.get("results", {}).get(label, {}).get(name)
+            lookup = name.startswith("lookup_")
+            memory = name.startswith("memory_")
+            if name in REFERENCE_ITEMS or base is None or (not lookup and not memory and base < MIN_SECONDS):
+                continue
+            ratio = seconds / base if base else float("inf")
+            if memory:
+                min_delta = MIN_MEMORY_DELTA_KB
+            else:
+                min_delta = MIN_LOOKUP_DELTA if lookup else MIN_DELTA_SECONDS
+            flag = ""
+            if ratio > 1 + threshold and seconds - base > min_delta:
+                regressions.append((label, name, base, seconds))
+                flag = "  <-- 回退"
+            print(f"[{label}] {name}: 基线 {base:.6g}, 当前 {seconds:.6g}, {ratio:.2f}x{flag}")
+    return regressions
+
+def show_help():
+    """显示帮助信息"""
+    print("生成流程和匹配引擎的基准测试")
+    print("\n用法: python3 benchmarks/bench_pipeline.py [选项]")
+    print("\n选项:")
+    print(f"  --sizes LIST       逗号分隔的语料规模: {', '.join(SIZES)}，默认值: {','.join(DEFAULT_SIZES)}")
+    print(f"  --repeat N         每个项目重复次数，取最短耗时，默认值: 3（1m 规模只运行 1 次）；查找类项目至少 {LOOKUP_REPEAT} 轮，取中位数")
+    print("  --output FILE      将结果写入 JSON 文件")
+    print("  --baseline FILE    与保存的基线结果比较，有回退时以状态码 1 退出")
+    print(f"  --threshold R      比基线慢超过该比例视为回退，默认值: {THRESHOLD}")
+    print("  --help             显示此帮助信息")
+
+if __name__ == "__main__":
+    sizes = DEFAULT_SIZES
+    repeat = 3
+    output_file = None
+    baseline_file = None
+    threshold = THRESHOLD
+
+    # 解析命令行参数
+    i = 1
+    while i < len(sys.argv):
+        if sys.argv[i] == "--sizes" and i+1 < len(sys.argv):
+            sizes = [size.strip().lower() for size in sys.argv[i+1].split(",") if size.strip()]
+            unknown = [size for size in sizes if size not in SIZES]
+            if unknown:
+                print(f"错误: 未知的规模 {', '.join(unknown)}，可选: {', '.join(SIZES)}")
+                sys.exit(1)
+            i += 2
+        elif sys.argv[i] == "--repeat" and i+1 < len(sys.argv):
+            repeat = max(int(sys.argv[i+1]), 1)
+            i += 2
+        elif sys.argv[i] == "--output" and i+1 < len(sys.argv):
+            output_file = sys.argv[i+1]
+            i += 2
+        elif sys.argv[i] == "--baseline" and i+1 < len(sys.argv):
+            baseline_file = sys.argv[i+1]
+            i += 2
+        elif sys.argv[i] == "--threshold" and i+1 < len(sys.argv):
+            threshold = float(sys.argv[i+1])
+            i += 2
+        elif sys.argv[i] == "--help":
+            show_help()
+            sys.exit(0)
+        else:
+            i += 1
+
+    results = {}
+    with tempfile.TemporaryDirectory(prefix="cn-pac-bench-") as work_root:
+        for size in sizes:
+            results[size] = run_size(size, SIZES[size], repeat, work_root)
+
+    report = {
+        "meta": {
+            "created_at": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "peak_rss_kb": build_metrics.peak_rss_kb(),
+            "repeat": repeat
+        },
+        "results": results
+    }
+    if output_file:
+        with open(output_file, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2, sort_keys=True)
+        print(f"\n基准结果已写入: {output_file}")
+
+    if baseline_file:
+        with open(baseline_file, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        print(f"\n与基线比较 ({baseline_file}, 阈值 {threshold:.0%}):")
+        regressions = compare_with_baseline(results, baseline, threshold)
+        if regressions:
+            print(f"发现 {len(regressions)} 项性能回退")
+            sys.exit(1)
+        print("未发现性能回退")
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+构建指标：记录 generate_pac.py 和 clean_direct_with_cnlist.py 各阶段（下载、解析、去重、合并、格式化、写入）
+的耗时和内存、各来源的条目数和输出文件大小，并写入 JSON 文件，便于跨版本跟踪性能，
+也可以对整次运行生成 cProfile 数据。
+
+未调用 start_run 时所有记录函数都不做任何事，不影响正常运行。
+"""
+
+import cProfile
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+try:
+    import resource
+except ImportError:  # Windows 没有 resource 模块
+    resource = None
+
+_lock = threading.Lock()
+_metrics = None
+
+def peak_rss_kb():
+    """返回当前进程的内存峰值（KB），无法获取时返回 None"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss 在 Linux 上以 KB 为单位，在 macOS 上以字节为单位
+    return peak // 1024 if sys.platform == "darwin" else peak
+
+def current_rss_kb():
+    """返回当前进程的常驻内存（KB），只在有 /proc 的系统上可用，否则返回 None"""
+    try:
+        with open("/proc/self/statm", "r") as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE") // 1024
+    except (OSError, ValueError, IndexError, AttributeError):
+        return None
+
+def start_run(tool):
+    """开始记录一次运行的指标，tool 为脚本名称"""
+    global _metrics
+    _metrics = {
+        "tool": tool,
+        "argv": sys.argv[1:],
+        "started_at": datetime.now().isoformat(timespec="seconds"),
+        "start": time.perf_counter(),
+        "stages": {},
+        "sources": {},
+        "rule_sets": {},
+        "outputs": {}
+    }
+
+def enabled():
+    return _metrics is not None
+
+def add_stage(name, seconds, rss_start=None, rss_end=None, peak_rss=None):
+    """累加一个阶段的耗时，同一阶段多次调用（如每个来源各合并一次）时累计次数和耗时，内存取最大值"""
+    if _metrics is None:
+        return
+    with _lock:
+        stage = _metrics["stages"].setdefault(name, {"seconds": 0.0, "calls": 0})
+        stage["seconds"] = round(stage["seconds"] + seconds, 6)
+        stage["calls"] += 1
+        for key, value in (("rss_start_kb", rss_start), ("rss_end_kb", rss_end), ("peak_rss_kb", peak_rss)):
+            if value is not None:
+                stage[key] = max(stage.get(key, 0), value)
+
+@contextmanager
+def stage(name):
+    """记录 with 块的耗时，以及开始和结束时的常驻内存、结束时的内存峰值"""
+    if _metrics is None:
+        yield
+        return
+    rss_start = current_rss_kb()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        add_stage(name, time.perf_counter() - start, rss_start, current_rss_kb(), peak_rss_kb())
+
+def record(section, key, value):
+    """记录 section（sources / rule_sets / outputs 等）下 key 的值，值为字典时与已有内容合并"""
+    if _metrics is None:
+        return
+    with _lock:
+        current = _metrics.setdefault(section, {})
+        if isinstance(value, dict) and isinstance(current.get(key), dict):
+            current[key].update(value)
+        else:
+            current[key] = value
+
+def save(filename):
+    """写入 JSON 指标文件"""
+    if _metrics is None:
+        return
+    result = {key: value for key, value in _metrics.items() if key != "start"}
+    result["finished_at"] = datetime.now().isoformat(timespec="seconds")
+    result["total_seconds"] = round(time.perf_counter() - _metrics["start"], 6)
+    result["peak_rss_kb"] = peak_rss_kb()
+    with open(filename, "w", encoding="utf-8") as f:
+        json.dump(result, f, ensure_ascii=False, indent=2, sort_keys=True)
+    print(f"运行指标已写入: {filename}")
+
+def run(func, tool, metrics_file=None, profile_file=None):
+    """
+    执行 func 并返回其结果：metrics_file 不为空时记录并写入运行指标，
+    profile_file 不为空时对整次运行做 cProfile 并写入该文件（可用 python3 -m pstats 查看）
+    """
+    if metrics_file:
+        start_run(tool)
+    profiler = cProfile.Profile() if profile_file else None
+    if profiler:
+        profiler.enable()
+    try:
+        return func()
+    finally:
+        if profiler:
+            profiler.disable()
+            profiler.dump_stats(profile_file)
+            print(f"cProfile 数据已写入: {profile_file}")
+        if metrics_file:
+            save(metrics_file)
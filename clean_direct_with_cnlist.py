@@ -2,144 +2,159 @@
 # -*- coding: utf-8 -*-
 
 """
-比较 ACL4SSR 中国域名列表和本地 direct.txt，
-从 direct.txt 中删除那些已经存在于中国域名列表中的域名
+比较中国域名列表和本地 direct.txt，
+从 direct.txt 中删除那些已经存在于中国域名列表中的域名。direct.txt 由 targets.json 中的
+所有构建目标共用，只删除被局域网列表覆盖、或被每个目标的中国域名列表来源都覆盖的规则
 
 使用方法:
-    python3 clean_direct_with_cnlist.py
+    python3 clean_direct_with_cnlist.py [--sources LIST] [--targets FILE] [--metrics FILE] [--profile FILE]
+    python3 clean_direct_with_cnlist.py --batch [--sources LIST] [--targets FILE] [--report FILE] [--metrics FILE] [--profile FILE]
+
+--batch 为非交互模式：并发下载所有来源，检查 direct.txt 和 proxy.txt，
+不询问直接原子地写回清理后的 direct.txt，并可将结果写入 JSON 报告，适合在 CI 中运行
 """
 
+import json
 import os
-import urllib.request
 import sys
 
-# 中国域名列表 URL
-CNLIST_URL = "https://raw.githubusercontent.com/ACL4SSR/ACL4SSR/master/Clash/ChinaDomain.list"
-DIRECT_TXT = "config/direct.txt"
-TIMEOUT = 30  # 设置请求超时时间（秒）
+import build_metrics
+import generate_pac
+from domain_index import DomainIndex
 
-def download_domain_list(url, desc="域名列表"): 
-    """通用的域名列表下载和解析函数，区分 DOMAIN-SUFFIX 和 DOMAIN 类型"""
-    print(f"正在下载 {desc}...")
-    domain_suffixes = set()
-    domain_exacts = set()
-    try:
-        req = urllib.request.Request(url)
-        with urllib.request.urlopen(req, timeout=TIMEOUT) as response:
-            content = response.read().decode('utf-8')
-            for line in content.splitlines():
-                line = line.strip()
-                if line.startswith('DOMAIN-SUFFIX,'):
-                    domain = line.split(',')[1].strip()
-                    domain_suffixes.add(domain)
-                elif line.startswith('DOMAIN,'):
-                    domain = line.split(',')[1].strip()
-                    domain_exacts.add(domain)
-        print(f"成功下载{desc}: {len(domain_suffixes)} 个后缀匹配, {len(domain_exacts)} 个全字匹配")
-        return {"suffixes": domain_suffixes, "domains": domain_exacts}
-    except Exception as e:
-        print(f"下载{desc}失败: {e}")
-        return {"suffixes": set(), "domains": set()}
+DIRECT_TXT = "config/direct.txt"
+PROXY_TXT = "config/proxy.txt"
+TARGETS_FILE = "targets.json"
+LOCAL_SOURCE = "localarea"  # 局域网列表会合并进每个构建目标
 
-def download_china_domains():
-    """下载中国域名列表，调用通用下载函数"""
-    return download_domain_list(CNLIST_URL, "ACL4SSR 中国域名列表")
+def download_sources(names):
+    """并发下载多个来源（generate_pac.DOMAIN_SOURCES 中的名称），返回 {来源名: 域名字典}，有来源无法获取时返回 None"""
+    return generate_pac.download_domain_lists(names)
 
-def read_direct_file():
-    """读取本地 direct.txt 文件，区分后缀匹配和全字匹配域名"""
-    direct_domains = {"suffixes": [], "domains": []}
+def read_direct_file(filename=DIRECT_TXT):
+    """
+    读取本地 direct.txt（或格式相同的 proxy.txt）文件，按 generate_pac.parse_rule_line 区分规则类型。
+    返回 ({规则类型: [规则]}, 原始格式的规则列表, 注释和空行列表)
+    """
+    direct_domains = {key: [] for key in generate_pac.RULE_KEYS}
     # 用于保存原始格式的域名，用于回写
     original_domains = []
     comments = []
     try:
-        with open(DIRECT_TXT, 'r', encoding='utf-8') as f:
+        with open(filename, 'r', encoding='utf-8') as f:
             for line in f:
                 line_strip = line.strip()
                 if not line_strip:  # 空行
                     comments.append(line)
                 elif line_strip.startswith('#'):  # 注释
                     comments.append(line)
-                else:  # 域名
+                else:  # 规则，无效的规则也原样保留
                     original_domains.append(line_strip)
-                    if line_strip.startswith('.'):
-                        # 以.开头的是后缀匹配规则，但需要去掉前面的.进行比较
-                        direct_domains["suffixes"].append(line_strip[1:])
-                    else:
-                        # 不以.开头的是全字匹配规则
-                        direct_domains["domains"].append(line_strip)
-        print(f"从 {DIRECT_TXT} 中读取了 {len(original_domains)} 个域名")
+                    rule = generate_pac.parse_rule_line(line_strip)
+                    if rule:
+                        direct_domains[rule[0]].append(rule[1])
+        print(f"从 {filename} 中读取了 {len(original_domains)} 个规则")
         return direct_domains, original_domains, comments
     except Exception as e:
-        print(f"读取 {DIRECT_TXT} 失败: {e}")
-        return {"suffixes": [], "domains": []}, [], []
+        print(f"读取 {filename} 失败: {e}")
+        return {key: [] for key in generate_pac.RULE_KEYS}, [], []
+
+def target_sources(filename=TARGETS_FILE):
+    """
+    返回构建目标（targets.json）使用的中国域名列表来源。direct.txt 由所有目标共用，
+    只有被每个目标的来源都覆盖的规则才能删除；文件不存在时保守地使用所有中国域名列表来源
+    """
+    if not os.path.exists(filename):
+        return [name for name in generate_pac.DOMAIN_SOURCES if name != LOCAL_SOURCE]
+    return list(dict.fromkeys(target["source"] for target in generate_pac.read_targets_file(filename)))
 
-def check_duplicate_domains(china_domains, direct_domains, original_domains):
+def find_covering_rules(source_domains, rules):
+    """
+    查找 rules（原始格式，.example.com 为后缀）中被各来源覆盖的规则，返回 {规则: {来源名: 覆盖它的最近一条来源规则}}。
+    只检查后缀和全字匹配规则，关键字、正则和 IP 段规则不会出现在结果中。每个来源用其解析后的 DomainIndex 查询一次：后缀规则只会被来源中相同或上级的后缀覆盖；
+    全字匹配规则还会被来源中相同的全字匹配域名覆盖，与 PAC 的匹配方式一致
     """
-    检查重复的域名，并返回重复域名信息以及清理后的域名列表
+    suffix_rules = {}
+    exact_rules = {}
+    for rule in rules:
+        parsed = generate_pac.parse_rule_line(rule)
+        if parsed and parsed[0] == "suffixes":
+            suffix_rules.setdefault(parsed[1].lower(), []).append(rule)
+        elif parsed and parsed[0] == "domains":
+            exact_rules.setdefault(parsed[1].lower(), []).append(rule)
+    suffix_index = DomainIndex(suffix_rules)
+    exact_index = DomainIndex(exact_rules)
+    covering = {}
+    for name, domains in source_domains.items():
+        source_suffixes = DomainIndex.of(domains.get("suffixes", ()))
+        source_exact = domains.get("domains", ())
+        for index, originals in ((suffix_index, suffix_rules), (exact_index, exact_rules)):
+            for domain, cover in index.coverage(source_suffixes):
+                if originals is exact_rules and domain in source_exact:
+                    cover = domain
+                if cover is not None:
+                    for rule in originals[domain]:
+                        covering.setdefault(rule, {})[name] = cover
+    return covering
+
+def check_duplicate_domains(source_domains, original_domains, china_sources):
     """
-    def check_duplicates_and_subdomains(custom_list, base_set, domain_map):
-        duplicates = []
-        child_domains = []
-        to_remove = set()
-        for custom in custom_list:
-            if custom in base_set:
-                duplicates.append(domain_map[custom])
-                to_remove.add(custom)
-                continue
-            parts = custom.split('.')
-            for i in range(1, len(parts)):
-                parent = '.'.join(parts[i:])
-                if parent in base_set:
-                    child_domains.append((domain_map[custom], parent))
-                    to_remove.add(custom)
-                    break
-        return duplicates, child_domains, to_remove
-
-    # 创建原始域名到处理后域名的映射
-    domain_map = {}
-    for domain in original_domains:
-        if domain.startswith('.'):
-            domain_map[domain[1:]] = domain
+    检查 original_domains 中被来源规则覆盖的域名。被局域网列表覆盖，或被 china_sources
+    （所有构建目标的中国域名列表来源）中每个来源都覆盖的规则可以删除；只被部分来源覆盖的规则保留。
+    关键字、正则和 IP 段规则不参与检查，原样保留在清理后的列表中。
+    返回 (完全匹配的域名列表, [(子域名, 父域名)], 清理后的域名列表,
+    [(可删除的规则, 覆盖它的最近一条来源规则, {来源名: 覆盖它的域名})], [(只被部分来源覆盖的规则, {来源名: 覆盖它的域名})])
+    """
+    covering = find_covering_rules(source_domains, original_domains)
+    duplicates = []
+    child_domains = []
+    covered = []
+    partial = []
+    clean_domains = []
+    for rule in original_domains:
+        covers = covering.get(rule)
+        if not covers:
+            clean_domains.append(rule)
+            continue
+        if LOCAL_SOURCE in covers:
+            parent = covers[LOCAL_SOURCE]
+        elif all(name in covers for name in china_sources):
+            # 取各来源中最近的一条覆盖规则
+            parent = max((covers[name] for name in china_sources), key=len)
+        else:
+            partial.append((rule, covers))
+            clean_domains.append(rule)
+            continue
+        covered.append((rule, parent, covers))
+        if parent == rule.lstrip('.').lower():
+            duplicates.append(rule)
         else:
-            domain_map[domain] = domain
-
-    cn_suffixes = china_domains.get("suffixes", set())
-    cn_exact_domains = china_domains.get("domains", set())
-    direct_suffixes = direct_domains.get("suffixes", [])
-    direct_exact_domains = direct_domains.get("domains", [])
-
-    dups1, childs1, remove1 = check_duplicates_and_subdomains(direct_suffixes, cn_suffixes, domain_map)
-    dups2, childs2, remove2 = check_duplicates_and_subdomains(direct_exact_domains, cn_exact_domains, domain_map)
-
-    # 检查自定义全字匹配是否是中国域名后缀的子域名
-    childs3 = []
-    remove3 = set()
-    for custom in direct_exact_domains:
-        parts = custom.split('.')
-        for i in range(1, len(parts)):
-            parent = '.'.join(parts[i:])
-            if parent in cn_suffixes:
-                childs3.append((domain_map[custom], parent))
-                remove3.add(custom)
-                break
-
-    all_to_remove = remove1 | remove2 | remove3
-    clean_domains = [domain for domain in original_domains if (domain.startswith('.') and domain[1:] not in all_to_remove) or (not domain.startswith('.') and domain not in all_to_remove)]
-    return dups1 + dups2, childs1 + childs2 + childs3, clean_domains
-
-def save_direct_file(clean_domains, comments):
+            child_domains.append((rule, parent))
+    return duplicates, child_domains, clean_domains, covered, partial
+
+def print_partial(partial, china_sources):
+    """输出只被部分来源覆盖、因此保留的规则"""
+    if partial:
+        print(f"\n以下 {len(partial)} 个规则只被部分来源覆盖（需要被 {', '.join(china_sources)} 全部覆盖或被局域网列表覆盖），保留不删除:")
+        for rule, covers in partial:
+            print(f"- {rule} ({', '.join(f'{name}: {cover}' for name, cover in covers.items())})")
+
+def save_direct_file(clean_domains, comments, filename=DIRECT_TXT):
     """
-    保存域名列表到文件，保留原始格式
+    保存域名列表到文件，保留原始格式。先写入同目录下的临时文件再替换，
+    写入中断时原文件保持不变
     
     Args:
         clean_domains: 清理后的原始格式域名列表
         comments: 注释和空行列表
+        filename: 写入的文件
     
     Returns:
         bool: 保存是否成功
     """
+    tmp_file = f"{filename}.tmp{os.getpid()}"
     try:
-        with open(DIRECT_TXT, 'w', encoding='utf-8') as f:
+        with open(tmp_file, 'w', encoding='utf-8') as f:
             # 写入注释
             for comment in comments:
                 f.write(comment)
@@ -147,32 +162,47 @@ def save_direct_file(clean_domains, comments):
             # 写入域名
             for domain in clean_domains:
                 f.write(domain + '\n')
+        os.replace(tmp_file, filename)
         
-        print(f"已成功更新 {DIRECT_TXT}")
+        print(f"已成功更新 {filename}")
         return True
     except Exception as e:
         print(f"保存文件失败: {e}")
+        if os.path.exists(tmp_file):
+            os.remove(tmp_file)
         return False
 
-def main():
-    # 下载中国域名列表
-    china_domains = download_china_domains()
-    if not china_domains.get("suffixes") and not china_domains.get("domains"):
+def main(sources, china_sources):
+    # 下载中国域名列表（多个来源时并发下载）
+    with build_metrics.stage("download"):
+        source_domains = download_sources(sources)
+    if source_domains is None or not any(rules.get("suffixes") or rules.get("domains") for rules in source_domains.values()):
         print("无法获取中国域名列表，退出程序")
         return
     
     # 读取 direct.txt
-    direct_domains, original_domains, comments = read_direct_file()
-    if not direct_domains.get("suffixes") and not direct_domains.get("domains"):
+    with build_metrics.stage("parse"):
+        direct_domains, original_domains, comments = read_direct_file()
+    build_metrics.record("sources", "direct", {key: len(values) for key, values in direct_domains.items()})
+    if not original_domains:
         print("无法读取 direct.txt 或文件为空，退出程序")
         return
     
     # 检查重复域名并获取清理过的域名列表
-    duplicates, child_domains, clean_domains = check_duplicate_domains(china_domains, direct_domains, original_domains)
+    with build_metrics.stage("dedup"):
+        duplicates, child_domains, clean_domains, _, partial = check_duplicate_domains(source_domains, original_domains, china_sources)
+    build_metrics.record("rule_sets", "direct", {
+        "original_count": len(original_domains),
+        "duplicates": len(duplicates),
+        "child_domains": len(child_domains),
+        "partial": len(partial),
+        "clean_count": len(clean_domains)
+    })
     
     # 输出统计信息
     print(f"\n发现 {len(duplicates)} 个与中国域名列表完全匹配的域名")
     print(f"发现 {len(child_domains)} 个是中国域名列表中域名的子域名")
+    print_partial(partial, china_sources)
     
     # 如果有重复项或子域名，询问是否删除
     if duplicates or child_domains:
@@ -195,7 +225,10 @@ def main():
             return
         
         # 保存清理后的文件
-        if save_direct_file(clean_domains, comments):
+        with build_metrics.stage("write"):
+            saved = save_direct_file(clean_domains, comments)
+        if saved:
+            build_metrics.record("outputs", DIRECT_TXT, {"bytes": os.path.getsize(DIRECT_TXT)})
             print(f"\n成功从 {DIRECT_TXT} 中删除了 {len(duplicates) + len(child_domains)} 个域名")
             print(f"原始域名数量: {len(original_domains)}")
             print(f"清理后域名数量: {len(clean_domains)}")
@@ -204,5 +237,162 @@ def main():
     else:
         print(f"\n{DIRECT_TXT} 中没有发现与中国域名列表重复的域名")
 
+def covered_report(covered):
+    """将 check_duplicate_domains 返回的可删除规则转换为报告中的条目"""
+    return [
+        {"rule": rule, "covered_by": parent, "exact": parent == rule.lstrip('.').lower(), "sources": covers}
+        for rule, parent, covers in covered
+    ]
+
+def partial_report(partial):
+    """将 check_duplicate_domains 返回的只被部分来源覆盖的规则转换为报告中的条目"""
+    return [{"rule": rule, "sources": covers} for rule, covers in partial]
+
+def run_batch(sources, china_sources, report_file=None):
+    """
+    非交互模式：并发下载 sources 中的所有来源，将 direct.txt 中被局域网列表或 china_sources 中
+    每个来源都覆盖的规则直接删除并原子地写回，只被部分来源覆盖的规则只报告；proxy.txt 中被来源覆盖的规则
+    会覆盖来源的直连判定，只报告不删除。成功返回 True
+    """
+    with build_metrics.stage("download"):
+        source_domains = download_sources(sources)
+    if source_domains is None:
+        print("无法获取所有来源的域名列表，退出程序")
+        return False
+    empty_sources = [name for name, rules in source_domains.items() if not rules.get("suffixes") and not rules.get("domains")]
+    for name in empty_sources:
+        print(f"警告: 来源 {name} 没有可用的域名规则")
+    if len(empty_sources) == len(source_domains):
+        print("无法获取任何来源的域名列表，退出程序")
+        return False
+
+    with build_metrics.stage("parse"):
+        direct_domains, direct_rules, direct_comments = read_direct_file(DIRECT_TXT)
+        _, proxy_rules, _ = read_direct_file(PROXY_TXT)
+    build_metrics.record("sources", "direct", {key: len(values) for key, values in direct_domains.items()})
+
+    with build_metrics.stage("dedup"):
+        duplicates, child_domains, clean_domains, direct_covered, direct_partial = check_duplicate_domains(
+            source_domains, direct_rules, china_sources
+        )
+        proxy_covering = find_covering_rules(source_domains, proxy_rules)
+        proxy_covered = [(rule, proxy_covering[rule]) for rule in proxy_rules if rule in proxy_covering]
+    build_metrics.record("rule_sets", "direct", {
+        "original_count": len(direct_rules),
+        "duplicates": len(duplicates),
+        "child_domains": len(child_domains),
+        "partial": len(direct_partial),
+        "clean_count": len(clean_domains)
+    })
+
+    print(f"\n{DIRECT_TXT}: {len(duplicates)} 个与来源完全匹配, {len(child_domains)} 个是来源中域名的子域名")
+    for rule, parent, covers in direct_covered:
+        print(f"- {rule} ({parent}, 来源: {', '.join(covers)})")
+    print_partial(direct_partial, china_sources)
+    print(f"{PROXY_TXT}: {len(proxy_covered)} 个被来源覆盖（代理规则优先，不删除）")
+    for rule, covers in proxy_covered:
+        print(f"- {rule} ({', '.join(f'{name}: {cover}' for name, cover in covers.items())})")
+
+    saved = True
+    if direct_covered:
+        with build_metrics.stage("write"):
+            saved = save_direct_file(clean_domains, direct_comments, DIRECT_TXT)
+        if saved:
+            build_metrics.record("outputs", DIRECT_TXT, {"bytes": os.path.getsize(DIRECT_TXT)})
+            print(f"原始域名数量: {len(direct_rules)}, 清理后域名数量: {len(clean_domains)}")
+
+    if report_file:
+        report = {
+            "sources": {name: generate_pac.rule_counts(rules) for name, rules in source_domains.items()},
+            "empty_sources": empty_sources,
+            "target_sources": china_sources,
+            "direct": {
+                "file": DIRECT_TXT,
+                "original_count": len(direct_rules),
+                "clean_count": len(clean_domains),
+                "written": bool(direct_covered) and saved,
+                "removed": covered_report(direct_covered),
+                "partially_covered": partial_report(direct_partial)
+            },
+            "proxy": {
+                "file": PROXY_TXT,
+                "count": len(proxy_rules),
+                "covered": partial_report(proxy_covered)
+            }
+        }
+        with open(report_file, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"检查结果已写入: {report_file}")
+    return saved
+
+def show_help():
+    """显示帮助信息"""
+    print("清理 direct.txt 中已存在于中国域名列表的域名")
+    print("\n用法: python3 clean_direct_with_cnlist.py [选项]")
+    print("\n选项:")
+    print(f"  --sources LIST     逗号分隔的来源: {', '.join(generate_pac.DOMAIN_SOURCES)}")
+    print(f"                     默认值: {LOCAL_SOURCE} 和构建目标使用的来源（--batch 时为所有来源）")
+    print(f"  --targets FILE     构建目标列表，只删除被 {LOCAL_SOURCE} 或其中每个目标的来源都覆盖的规则，默认值: {TARGETS_FILE}")
+    print("                     （文件不存在时要求被所有中国域名列表来源覆盖）")
+    print("  --batch            非交互模式：同时检查 direct.txt 和 proxy.txt，不询问直接原子地写回 direct.txt，")
+    print("                     无法获取任何来源或写入失败时以状态码 1 退出")
+    print("  --report FILE      --batch 时将检查结果写入 JSON 文件")
+    print("  --metrics FILE     将各阶段的耗时和内存写入 JSON 文件")
+    print("  --profile FILE     对整次运行做 cProfile，结果写入 FILE")
+    print("  --help             显示此帮助信息")
+
 if __name__ == "__main__":
-    main()
+    metrics_file = None
+    profile_file = None
+    sources = None
+    batch = False
+    report_file = None
+    targets_file = TARGETS_FILE
+
+    # 解析命令行参数
+    i = 1
+    while i < len(sys.argv):
+        if sys.argv[i] == "--metrics" and i+1 < len(sys.argv):
+            metrics_file = sys.argv[i+1]
+            i += 2
+        elif sys.argv[i] == "--profile" and i+1 < len(sys.argv):
+            profile_file = sys.argv[i+1]
+            i += 2
+        elif sys.argv[i] == "--sources" and i+1 < len(sys.argv):
+            sources = list(dict.fromkeys(name.strip() for name in sys.argv[i+1].split(",") if name.strip()))
+            unknown = [name for name in sources if name not in generate_pac.DOMAIN_SOURCES]
+            if unknown or not sources:
+                print(f"错误: --sources 必须为 {', '.join(generate_pac.DOMAIN_SOURCES)} 中的一个或多个")
+                sys.exit(1)
+            i += 2
+        elif sys.argv[i] == "--batch":
+            batch = True
+            i += 1
+        elif sys.argv[i] == "--report" and i+1 < len(sys.argv):
+            report_file = sys.argv[i+1]
+            i += 2
+        elif sys.argv[i] == "--targets" and i+1 < len(sys.argv):
+            targets_file = sys.argv[i+1]
+            i += 2
+        elif sys.argv[i] == "--help":
+            show_help()
+            sys.exit(0)
+        else:
+            i += 1
+
+    try:
+        china_sources = target_sources(targets_file)
+    except (OSError, ValueError) as e:
+        print(f"读取构建目标失败: {e}")
+        sys.exit(1)
+    missing = [name for name in china_sources if sources and name not in sources]
+    if missing:
+        print(f"警告: --sources 中没有构建目标使用的 {', '.join(missing)}，只有被 {LOCAL_SOURCE} 覆盖的规则会被删除")
+
+    if batch:
+        if not build_metrics.run(lambda: run_batch(sources or list(generate_pac.DOMAIN_SOURCES), china_sources, report_file),
+                                 "clean_direct_with_cnlist", metrics_file, profile_file):
+            sys.exit(1)
+    else:
+        build_metrics.run(lambda: main(sources or [LOCAL_SOURCE] + china_sources, china_sources),
+                          "clean_direct_with_cnlist", metrics_file, profile_file)
@@ -4,9 +4,37 @@
 import os
 import sys
 import json
+import time
+import hashlib
+import codecs
+import gzip
+import struct
+import zlib
+import ipaddress
+import urllib.error
 import urllib.request
 import re
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from datetime import datetime
+from itertools import islice
+
+import build_metrics
+from domain_index import BUILD_CHUNK, DomainIndex, DomainIndexBuilder
+
+try:
+    import resource
+except ImportError:  # Windows 没有 resource 模块
+    resource = None
+
+# 可选依赖：安装后 --compress 会额外生成 .br（优先）或 .zst 文件
+try:
+    import brotli
+except ImportError:
+    brotli = None
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
 
 # 配置参数
 CNLIST_METACUBEX_URL = "https://raw.githubusercontent.com/MetaCubeX/meta-rules-dat/meta/geo/geosite/geolocation-cn.list"
@@ -19,122 +47,674 @@ PROXY_SERVER = "SOCKS5 127.0.0.1:%mixed-port%; PROXY 127.0.0.1:%mixed-port%; DIR
 DIRECT_RULE = "DIRECT"  # 默认直连规则
 DEFAULT_RULE = PROXY_SERVER  # 默认规则与代理服务器相同
 TIMEOUT = 30  # 设置请求超时时间（秒）
+DECISION_CACHE_SIZE = 1024  # PAC 中按 host 缓存判定结果的最大条数，0 表示不缓存
+HOT_HOSTS_SIZE = 256  # 根据访问记录预先计算判定结果的热点 host 数量
+DNSMASQ_DIRECT_SERVER = "114.114.114.114"  # dnsmasq 配置中直连域名使用的上游 DNS
+DNSMASQ_PROXY_SERVER = "127.0.0.1#5353"  # dnsmasq 配置中代理域名使用的上游 DNS（如本地代理提供的 DNS）
+RULE_BINARY_MAGIC = b"CNPR"  # 紧凑二进制规则文件的文件头
+RULE_BINARY_VERSION = 2  # 2 起增加了关键字和正则规则，仍可读取版本 1
+RETRIES = 2  # 下载失败后的重试次数
+RETRY_BACKOFF = 1.0  # 首次重试前的等待时间（秒），之后每次翻倍
+CHUNK_SIZE = 64 * 1024  # 流式下载时每次读取的字节数
+BUILD_MANIFEST = ".build-manifest.json"  # 输出目录中记录各目标输入摘要的构建清单
+# 影响输出内容的模块（与本脚本位于同一目录），连同 PAC 模板一起计入构建清单中的生成器摘要
+GENERATOR_MODULES = ("generate_pac.py", "domain_index.py", "pac_engine.py")
+CACHE_DIR = "cache"  # 上游域名列表的本地缓存目录
+PARSER_VERSION = 3  # 解析逻辑变化时递增，旧版本缓存会从正文重新解析
+CACHE_MAX_BYTES = 200 * 1024 * 1024  # 缓存目录的容量上限（字节）
+CACHE_MAX_AGE = 30 * 24 * 3600  # 超过该时间（秒）未确认有效的缓存将被淘汰
+
+# PAC 渲染选项的默认值
+DEFAULT_RENDER_OPTIONS = {
+    "encoding": "flat",  # 域名表编码方式，见 PAC_ENCODINGS
+    "decision_cache": DECISION_CACHE_SIZE,
+    "minify": False,  # 去掉模板中的注释和缩进，域名表使用紧凑 JSON
+    "compress": False,  # 在 PAC 文件旁生成预压缩的 .gz 和 .br/.zst 文件
+    "host_profile": None,  # 访问日志或 host 访问次数文件，用于生成热点 host 表
+    "hot_hosts": HOT_HOSTS_SIZE,
+    "formats": ["pac"]  # 输出格式，见 EMITTERS
+}
+
+# 热点 host 表中判定结果的编码，与 pac-template 中 findProxyForHost 一致
+HOT_DECISIONS = {"direct": 1, "proxy": 2, "default": 3}
+
+# 域名列表来源: 名称 -> (URL, 描述)
+DOMAIN_SOURCES = {
+    "localarea": (LOCALAREA_URL, "ACL4SSR 局域网域名列表"),
+    "acl4ssr": (CNLIST_ACL4SSR_URL, "ACL4SSR 中国域名列表"),
+    "metacubex": (CNLIST_METACUBEX_URL, "MetaCubeX 中国域名列表"),
+}
 
 def ensure_dir(directory):
     """确保目录存在，不存在则创建"""
     if not os.path.exists(directory):
         os.makedirs(directory)
 
-def download_domain_list(url, skip_download=False, desc="域名列表"):
-    """通用的域名列表下载和解析函数，区分 DOMAIN-SUFFIX 和 DOMAIN 类型"""
+def write_file_atomic(filename, data):
+    """
+    先写入同目录下的隐藏临时文件再替换目标文件，读取方（如 pac_server）
+    不会读到写了一半的文件；写入失败时删除临时文件并抛出异常
+    """
+    directory, name = os.path.split(filename)
+    tmp_file = os.path.join(directory, f".{name}.tmp{os.getpid()}")
+    try:
+        with open(tmp_file, "wb") as f:
+            f.write(data)
+        os.replace(tmp_file, filename)
+    except BaseException:
+        if os.path.exists(tmp_file):
+            os.remove(tmp_file)
+        raise
+
+RULE_KEYS = ("suffixes", "domains", "cidrs", "keywords", "regexes")  # 规则字典中的各类规则
+DOMAIN_KEYS = ("suffixes", "domains")  # 以 DomainIndex 保存的规则，其余数量较少的规则使用 set
+
+def empty_rules():
+    """返回空的规则字典：后缀匹配、全字匹配域名、IPv4 网段、域名关键字和域名正则"""
+    return {key: DomainIndex() if key in DOMAIN_KEYS else set() for key in RULE_KEYS}
+
+def compact_rules(rules):
+    """将规则字典中的后缀和全字匹配域名转换为 DomainIndex，其余规则转换为 set"""
+    return {key: DomainIndex.of(rules.get(key, ())) if key in DOMAIN_KEYS else set(rules.get(key, ())) for key in RULE_KEYS}
+
+def rule_counts(rules):
+    """返回规则字典中各类规则的数量 {"suffixes": n, "domains": n, "cidrs": n, "keywords": n, "regexes": n}"""
+    return {key: len(rules.get(key, ())) for key in RULE_KEYS}
+
+def describe_rules(rules):
+    """生成规则数量的描述文本"""
+    text = f"{len(rules['suffixes'])} 个后缀匹配, {len(rules['domains'])} 个全字匹配"
+    if rules.get("cidrs"):
+        text += f", {len(rules['cidrs'])} 个 IP 段"
+    if rules.get("keywords"):
+        text += f", {len(rules['keywords'])} 个关键字"
+    if rules.get("regexes"):
+        text += f", {len(rules['regexes'])} 个正则"
+    return text
+
+def parse_ipv4_cidr(text):
+    """将 IPv4 网段（如 10.0.0.0/8）规范化为字符串，不是 IPv4 网段时返回 None"""
+    try:
+        network = ipaddress.ip_network(text.strip(), strict=False)
+    except ValueError:
+        return None
+    return str(network) if network.version == 4 else None
+
+def parse_domain_regex(text):
+    """
+    检查 DOMAIN-REGEX 规则的正则能否编译，返回正则文本，无效时打印警告并返回 None。
+    按合并后的形式 (?:正则) 检查，保证同一列表的所有正则可以合并为一个
+    """
+    try:
+        re.compile(f"(?:{text})")
+    except re.error as e:
+        print(f"忽略无效的域名正则 {text}: {e}")
+        return None
+    return text
+
+def parse_domain_list(lines):
+    """
+    解析规则列表文本行，区分 DOMAIN-SUFFIX、DOMAIN、DOMAIN-KEYWORD、DOMAIN-REGEX 和 IP-CIDR 类型。
+    域名由 DomainIndexBuilder 每批转换为键，解析完成后一次性排序、去重为 DomainIndex，不保留域名字符串列表
+    """
+    suffix_builder = DomainIndexBuilder()
+    exact_builder = DomainIndexBuilder()
+    domain_suffixes = []
+    domain_exacts = []
+    cidrs = set()
+    keywords = set()
+    regexes = set()
+    lines = iter(lines)
+    while True:
+        batch = list(islice(lines, BUILD_CHUNK))
+        if not batch:
+            break
+        for line in batch:
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            if line.startswith('DOMAIN-SUFFIX,'):
+                domain = line.split(',')[1].strip()
+                domain_suffixes.append(domain)
+            elif line.startswith('DOMAIN,'):
+                domain = line.split(',')[1].strip()
+                domain_exacts.append(domain)
+            elif line.startswith('IP-CIDR,'):
+                # IP-CIDR,192.168.0.0/16,no-resolve；IP-CIDR6 不在此处理
+                cidr = parse_ipv4_cidr(line.split(',')[1])
+                if cidr:
+                    cidrs.add(cidr)
+            elif line.startswith('DOMAIN-KEYWORD,'):
+                keyword = line.split(',')[1].strip().lower()
+                if keyword:
+                    keywords.add(keyword)
+            elif line.startswith('DOMAIN-REGEX,'):
+                # 正则中可能含有逗号，取第一个逗号之后的全部内容
+                regex = parse_domain_regex(line.split(',', 1)[1].strip())
+                if regex:
+                    regexes.add(regex)
+            elif line.startswith('+.'):
+                # MetaCubeX format: +.example.com means suffix match
+                domain = line[2:].strip()
+                domain_suffixes.append(domain)
+            elif ',' not in line and '/' not in line:
+                # Plain domain (no Clash rule prefix, not a URL path)
+                domain_exacts.append(line)
+        # 每批的域名整批转换为键，不保留到解析结束
+        suffix_builder.extend(domain_suffixes)
+        exact_builder.extend(domain_exacts)
+        domain_suffixes.clear()
+        domain_exacts.clear()
+    return {
+        "suffixes": suffix_builder.build(),
+        "domains": exact_builder.build(),
+        "cidrs": cidrs,
+        "keywords": keywords,
+        "regexes": regexes
+    }
+
+def cache_paths(cache_dir, url):
+    """返回某个来源在缓存目录中的正文文件和元数据文件路径"""
+    key = hashlib.sha1(url.encode("utf-8")).hexdigest()[:16]
+    return os.path.join(cache_dir, f"{key}.body"), os.path.join(cache_dir, f"{key}.json")
+
+def write_cache_meta(meta_file, meta, rules):
+    """原子地写入缓存元数据和解析结果"""
+    data = dict(meta, parser_version=PARSER_VERSION)
+    for key, values in rules.items():
+        data[key] = sorted(values)
+    tmp_file = f"{meta_file}.tmp{os.getpid()}"
+    with open(tmp_file, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.replace(tmp_file, meta_file)
+
+def load_cache_entry(cache_dir, url):
+    """读取缓存的元数据和解析结果（meta["rules"]），不存在或损坏时返回 None"""
+    if not cache_dir:
+        return None
+    body_file, meta_file = cache_paths(cache_dir, url)
+    try:
+        with open(meta_file, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta.get("url") != url or not os.path.exists(body_file):
+            return None
+        if meta.get("parser_version") == PARSER_VERSION:
+            meta["rules"] = compact_rules({key: meta.get(key, []) for key in RULE_KEYS})
+        else:
+            # 解析逻辑已更新，从缓存的正文重新解析，而不是一直沿用旧的解析结果
+            with open(body_file, "r", encoding="utf-8", errors="replace") as f:
+                meta["rules"] = parse_domain_list(f)
+            write_cache_meta(meta_file, {k: meta.get(k) for k in ("url", "etag", "last_modified", "fetched_at")}, meta["rules"])
+        # 只更新访问时间，供按容量淘汰时参考；修改时间保留为最近一次确认有效的时间
+        os.utime(meta_file, (time.time(), os.stat(meta_file).st_mtime))
+        return meta
+    except (OSError, ValueError, KeyError):
+        return None
+
+def save_cache_entry(cache_dir, url, body_tmp_file, headers, domains):
+    """保存下载过程中写入临时文件的正文，以及 ETag/Last-Modified 和解析后的域名集合"""
+    try:
+        body_file, meta_file = cache_paths(cache_dir, url)
+        meta = {
+            "url": url,
+            "etag": headers.get("ETag"),
+            "last_modified": headers.get("Last-Modified"),
+            "fetched_at": time.time()
+        }
+        os.replace(body_tmp_file, body_file)
+        write_cache_meta(meta_file, meta, domains)
+    except OSError as e:
+        print(f"写入缓存失败: {e}")
+
+def evict_cache(cache_dir, max_bytes=CACHE_MAX_BYTES, max_age=CACHE_MAX_AGE):
+    """淘汰超过 max_age 秒未更新的缓存，并在总大小超过 max_bytes 时按最近访问时间从旧到新删除"""
+    if not cache_dir or not os.path.isdir(cache_dir):
+        return
+    entries = []
+    now = time.time()
+    for name in os.listdir(cache_dir):
+        if not name.endswith(".json"):
+            continue
+        meta_file = os.path.join(cache_dir, name)
+        body_file = meta_file[:-len(".json")] + ".body"
+        files = [f for f in (meta_file, body_file) if os.path.exists(f)]
+        stat = os.stat(meta_file)
+        if now - stat.st_mtime > max_age:
+            for f in files:
+                os.remove(f)
+            continue
+        entries.append((stat.st_atime, sum(os.path.getsize(f) for f in files), files))
+    total = sum(size for _, size, _ in entries)
+    for _, size, files in sorted(entries):
+        if total <= max_bytes:
+            break
+        for f in files:
+            os.remove(f)
+        total -= size
+
+def iter_stream_lines(stream, stats, sink=None, chunk_size=CHUNK_SIZE):
+    """
+    按块读取响应并逐行产出文本，同时把原始数据写入 sink（缓存文件）。
+    内存中只保留当前块和未结束的半行，stats 中记录读取耗时和缓冲峰值。
+    """
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    pending = ""
+    while True:
+        read_start = time.perf_counter()
+        chunk = stream.read(chunk_size)
+        stats["read_time"] += time.perf_counter() - read_start
+        if not chunk:
+            break
+        stats["bytes"] += len(chunk)
+        if sink:
+            sink.write(chunk)
+        text = pending + decoder.decode(chunk)
+        stats["buffer_peak"] = max(stats["buffer_peak"], len(chunk) + len(text))
+        lines = text.split("\n")
+        pending = lines.pop()
+        yield from lines
+    pending += decoder.decode(b"", final=True)
+    if pending:
+        yield pending
+
+def download_domain_list(url, skip_download=False, desc="域名列表", cache_dir=CACHE_DIR, allow_missing=False):
+    """
+    通用的域名列表下载和解析函数，区分 DOMAIN-SUFFIX 和 DOMAIN 类型
+
+    有缓存时发送条件请求，304 时直接使用缓存的解析结果；
+    跳过下载或下载失败时回退到最近一次成功的缓存快照。
+    既没有下载成功也没有缓存快照时返回 None，调用方应放弃构建，
+    只有跳过下载且 allow_missing 为 True（本地调试）时才按空列表处理
+    """
+    cached = load_cache_entry(cache_dir, url)
     if skip_download:
-        print(f"跳过下载{desc}...")
-        return {"suffixes": set(), "domains": set()}
+        if cached:
+            print(f"跳过下载{desc}，使用缓存快照: {describe_rules(cached['rules'])}")
+            return cached["rules"]
+        if allow_missing:
+            print(f"跳过下载{desc}，没有缓存快照，按空列表处理")
+            return empty_rules()
+        print(f"跳过下载{desc}，但没有缓存快照")
+        return None
     print(f"正在下载 {desc}...")
-    domain_suffixes = set()
-    domain_exacts = set()
-    try:
-        req = urllib.request.Request(url, headers={"User-Agent": "Mozilla/5.0"})
-        with urllib.request.urlopen(req, timeout=TIMEOUT) as response:
-            content = response.read().decode('utf-8')
-            for line in content.splitlines():
-                line = line.strip()
-                if not line or line.startswith('#'):
-                    continue
-                if line.startswith('DOMAIN-SUFFIX,'):
-                    domain = line.split(',')[1].strip()
-                    domain_suffixes.add(domain)
-                elif line.startswith('DOMAIN,'):
-                    domain = line.split(',')[1].strip()
-                    domain_exacts.add(domain)
-                elif line.startswith('+.'):
-                    # MetaCubeX format: +.example.com means suffix match
-                    domain = line[2:].strip()
-                    domain_suffixes.add(domain)
-                elif ',' not in line and '/' not in line:
-                    # Plain domain (no Clash rule prefix, not a URL path)
-                    domain_exacts.add(line)
-        print(f"成功下载{desc}: {len(domain_suffixes)} 个后缀匹配, {len(domain_exacts)} 个全字匹配")
-        return {"suffixes": domain_suffixes, "domains": domain_exacts}
-    except Exception as e:
-        print(f"下载{desc}失败: {e}")
-        return {"suffixes": set(), "domains": set()}
+    start = time.perf_counter()
+    headers = {"User-Agent": "Mozilla/5.0"}
+    if cached and cached.get("etag"):
+        headers["If-None-Match"] = cached["etag"]
+    if cached and cached.get("last_modified"):
+        headers["If-Modified-Since"] = cached["last_modified"]
+    for attempt in range(RETRIES + 1):
+        body_tmp_file = None
+        try:
+            req = urllib.request.Request(url, headers=headers)
+            with urllib.request.urlopen(req, timeout=TIMEOUT) as response:
+                # 边下载边解析，原始数据同时流式写入缓存临时文件
+                stats = {"read_time": 0.0, "bytes": 0, "buffer_peak": 0}
+                sink = None
+                if cache_dir:
+                    ensure_dir(cache_dir)
+                    body_tmp_file = f"{cache_paths(cache_dir, url)[0]}.tmp{os.getpid()}"
+                    sink = open(body_tmp_file, "wb")
+                try:
+                    domains = parse_domain_list(iter_stream_lines(response, stats, sink))
+                finally:
+                    if sink:
+                        sink.close()
+                response_headers = response.headers
+            if body_tmp_file:
+                save_cache_entry(cache_dir, url, body_tmp_file, response_headers, domains)
+                body_tmp_file = None
+            elapsed = time.perf_counter() - start
+            build_metrics.add_stage("parse", elapsed - stats["read_time"])
+            print(f"成功下载{desc}: {describe_rules(domains)}, "
+                  f"{stats['bytes'] / 1024:.0f} KB, 耗时 {elapsed:.2f} 秒 (解析 {elapsed - stats['read_time']:.2f} 秒), "
+                  f"缓冲峰值 {stats['buffer_peak'] / 1024:.0f} KB")
+            return domains
+        except urllib.error.HTTPError as e:
+            if e.code == 304 and cached:
+                # 304 表示缓存仍然有效，刷新修改时间以免被按时间淘汰
+                os.utime(cache_paths(cache_dir, url)[1])
+                print(f"{desc}未变化 (304)，使用缓存: {describe_rules(cached['rules'])}, 耗时 {time.perf_counter() - start:.2f} 秒")
+                return cached["rules"]
+            error = e
+            # 4xx 错误重试也不会成功，直接放弃
+            retryable = not 400 <= e.code < 500
+        except Exception as e:
+            error = e
+            retryable = True
+        finally:
+            if body_tmp_file and os.path.exists(body_tmp_file):
+                os.remove(body_tmp_file)
+        if attempt < RETRIES and retryable:
+            delay = RETRY_BACKOFF * (2 ** attempt)
+            print(f"下载{desc}失败: {error}，{delay:.1f} 秒后重试 ({attempt + 1}/{RETRIES})")
+            time.sleep(delay)
+        else:
+            print(f"下载{desc}失败: {error}，耗时 {time.perf_counter() - start:.2f} 秒")
+            break
+    if cached:
+        fetched_at = datetime.fromtimestamp(cached.get("fetched_at", 0)).strftime("%Y-%m-%d %H:%M")
+        print(f"使用 {fetched_at} 缓存的{desc}快照: {describe_rules(cached['rules'])}")
+        return cached["rules"]
+    print(f"没有可用的{desc}缓存快照")
+    return None
+
+def download_domain_lists(source_names, skip_download=False, cache_dir=CACHE_DIR, allow_missing=False):
+    """
+    并发下载多个域名列表来源，返回 {来源名: 域名字典}，总耗时取决于最慢的来源；
+    任一来源既没有下载成功也没有缓存快照时返回 None（见 download_domain_list）
+    """
+    names = list(dict.fromkeys(source_names))
 
-def download_china_domains(skip_download=False, source="metacubex"):
-    """下载中国域名列表，支持 acl4ssr / metacubex 两种来源"""
-    if source == "acl4ssr":
-        return download_domain_list(CNLIST_ACL4SSR_URL, skip_download, "ACL4SSR 中国域名列表")
-    else:  # metacubex (default)
-        return download_domain_list(CNLIST_METACUBEX_URL, skip_download, "MetaCubeX 中国域名列表")
+    def download_source(name):
+        start = time.perf_counter()
+        rules = download_domain_list(DOMAIN_SOURCES[name][0], skip_download, DOMAIN_SOURCES[name][1], cache_dir, allow_missing)
+        if rules is not None:
+            build_metrics.record("sources", name, dict(rule_counts(rules), seconds=round(time.perf_counter() - start, 6)))
+        return rules
 
-def download_localarea_domains(skip_download=False):
-    """下载局域网域名列表，调用通用下载函数"""
-    return download_domain_list(LOCALAREA_URL, skip_download, "ACL4SSR 局域网域名列表")
+    with ThreadPoolExecutor(max_workers=max(len(names), 1)) as executor:
+        futures = {name: executor.submit(download_source, name) for name in names}
+        results = {name: future.result() for name, future in futures.items()}
+    evict_cache(cache_dir)
+    if resource and not skip_download:
+        # ru_maxrss 在 Linux 上以 KB 为单位，在 macOS 上以字节为单位
+        peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        peak_rss_mb = peak_rss / (1024 * 1024) if sys.platform == "darwin" else peak_rss / 1024
+        print(f"下载完成，进程内存峰值: {peak_rss_mb:.1f} MB")
+    missing = [name for name, rules in results.items() if rules is None]
+    if missing:
+        print(f"无法获取 {', '.join(DOMAIN_SOURCES[name][1] for name in missing)}：没有下载成功，也没有缓存快照")
+        return None
+    return results
+
+def parse_rule_line(line):
+    """
+    解析域名文件（config/direct.txt 等）中的一行，返回 (规则类型, 规则)，规则类型为 RULE_KEYS 之一；
+    空行、注释和无效的规则返回 None。以.开头的为后缀匹配，含 / 的 IPv4 网段（如 10.0.0.0/8）视为 IP 段规则，
+    DOMAIN-KEYWORD,xxx 和 DOMAIN-REGEX,xxx 分别为关键字和正则规则，其余为全字匹配
+    """
+    domain = line.strip()
+    if not domain or domain.startswith("#"):
+        return None
+    if domain.startswith("DOMAIN-KEYWORD,"):
+        keyword = domain.split(",", 1)[1].strip().lower()
+        return ("keywords", keyword) if keyword else None
+    if domain.startswith("DOMAIN-REGEX,"):
+        regex = parse_domain_regex(domain.split(",", 1)[1].strip())
+        return ("regexes", regex) if regex else None
+    if domain.startswith("IP-CIDR,") or "/" in domain:
+        cidr = parse_ipv4_cidr(domain.split(",")[1] if domain.startswith("IP-CIDR,") else domain)
+        return ("cidrs", cidr) if cidr else None
+    if domain.startswith("."):
+        # 以.开头的是后缀匹配规则，但需要去掉前面的.
+        return "suffixes", domain[1:]
+    # 不以.开头的是全字匹配规则
+    return "domains", domain
 
 def read_domain_file(filename):
-    """读取域名文件，根据是否以.开头来区分后缀匹配和全字匹配"""
-    domains = {"suffixes": set(), "domains": set()}
+    """读取域名文件，每行按 parse_rule_line 区分后缀匹配、全字匹配、IP 段、关键字和正则规则"""
+    domains = {key: set() for key in RULE_KEYS}
     
     with open(filename, "r") as f:
         for line in f:
-            domain = line.strip()
-            if domain and not domain.startswith("#"):
-                if domain.startswith("."):
-                    # 以.开头的是后缀匹配规则，但需要去掉前面的.
-                    domains["suffixes"].add(domain[1:])
-                else:
-                    # 不以.开头的是全字匹配规则
-                    domains["domains"].add(domain)
+            rule = parse_rule_line(line)
+            if rule:
+                domains[rule[0]].add(rule[1])
     
+    return compact_rules(domains)
+
+PAC_ENCODINGS = ("flat", "trie")  # PAC 中域名表的编码方式
+TRIE_END = None  # 字典树中标记规则终点的键，不会与任何域名标签冲突
+
+def json_separators(minify=False):
+    """PAC 中 JSON 字面量使用的分隔符，精简时不保留空格"""
+    return (",", ":") if minify else None
+
+def format_domain_set_for_pac(domains, minify=False):
+    """将域名集合格式化为 PAC 中以域名为键的查找表（JS 对象字面量）"""
+    return json.dumps(dict.fromkeys(sorted(domains), 1), ensure_ascii=False, separators=json_separators(minify))
+
+def encode_domain_trie(domains):
+    """
+    将域名集合编码为紧凑的反向标签字典树字符串，由 PAC 中的 decodeDomainTrie 还原。
+    例如 {"baidu.com", "qq.com", "mail.qq.com"} 编码为 "com(baidu,qq(,mail))"，
+    子节点列表开头的空标签表示父节点本身也是一条规则。
+    无法编码（含空标签或保留字符）的集合返回 None。
+    """
+    trie = {}
+    for domain in domains:
+        labels = domain.split(".")
+        if not all(labels) or any(c in domain for c in "(),"):
+            return None
+        node = trie
+        for label in reversed(labels):
+            node = node.setdefault(label, {})
+        node[TRIE_END] = True
+
+    def encode(node):
+        parts = []
+        for label in sorted(k for k in node if k is not TRIE_END):
+            child = node[label]
+            if len(child) == 1 and TRIE_END in child:
+                parts.append(label)
+            else:
+                inner = encode(child)
+                parts.append(f"{label}(,{inner})" if TRIE_END in child else f"{label}({inner})")
+        return ",".join(parts)
+
+    return encode(trie)
+
+def decode_domain_trie(encoded):
+    """将 encode_domain_trie 生成的字典树字符串还原为域名列表，与 PAC 中的 decodeDomainTrie 一致"""
+    if not encoded:
+        return []
+    # 按分隔符切分后标签与分隔符交替出现，末尾补一个逗号结束最后一个标签
+    tokens = re.split(r"([(),])", encoded) + [","]
+    domains = []
+    parents = []
+    parent = ""
+    closed = False
+    for i in range(0, len(tokens), 2):
+        label, c = tokens[i], tokens[i + 1]
+        if c == "(":
+            parents.append(parent)
+            parent = f"{label}.{parent}" if parent else label
+            closed = False
+        else:
+            if not closed:
+                domains.append(parent if not label else (f"{label}.{parent}" if parent else label))
+            if c == ")":
+                parent = parents.pop()
+            closed = c == ")"
     return domains
 
-def format_domain_lists_for_pac(domain_dict, local_domains=None):
-    """格式化域名列表为PAC文件需要的JSON格式，分别处理后缀和全字匹配域名"""
-    # 初始化返回字典
-    result = {
-        "suffixes": "",
-        "domains": ""
-    }
-    
-    # 处理后缀匹配域名
-    if "suffixes" in domain_dict and domain_dict["suffixes"]:
-        suffix_domains = list(sorted(domain_dict["suffixes"]))
-        result["suffixes"] = json.dumps(suffix_domains, ensure_ascii=False)
-    else:
-        result["suffixes"] = "[]"
-    
-    # 处理全字匹配域名
-    if "domains" in domain_dict and domain_dict["domains"]:
-        exact_domains = list(sorted(domain_dict["domains"]))
-        result["domains"] = json.dumps(exact_domains, ensure_ascii=False)
-    else:
-        result["domains"] = "[]"
-    
+def format_domain_lists_for_pac(domain_dict, local_domains=None, encoding="flat", minify=False):
+    """格式化域名列表为PAC文件需要的查找表，分别处理后缀和全字匹配域名"""
+    result = {}
+    for key in ("suffixes", "domains"):
+        domains = domain_dict.get(key, set())
+        encoded = encode_domain_trie(domains) if encoding == "trie" and domains else None
+        if encoded is None:
+            result[key] = format_domain_set_for_pac(domains, minify)
+        else:
+            result[key] = f"decodeDomainTrie({json.dumps(encoded, ensure_ascii=False)})"
     return result
 
+def merge_ip_ranges(cidrs):
+    """将 IPv4 网段集合转换为按起始地址排序、互不重叠的整数区间，返回 (起始地址列表, 结束地址列表)"""
+    ranges = sorted(
+        (int(network.network_address), int(network.broadcast_address))
+        for network in (ipaddress.ip_network(cidr) for cidr in cidrs)
+    )
+    starts, ends = [], []
+    for start, end in ranges:
+        if starts and start <= ends[-1] + 1:
+            ends[-1] = max(ends[-1], end)
+        else:
+            starts.append(start)
+            ends.append(end)
+    return starts, ends
+
+def ranges_to_cidrs(starts, ends):
+    """将 merge_ip_ranges 返回的整数区间还原为覆盖相同地址的最少 CIDR 集合"""
+    return {
+        str(network)
+        for start, end in zip(starts, ends)
+        for network in ipaddress.summarize_address_range(ipaddress.IPv4Address(start), ipaddress.IPv4Address(end))
+    }
+
+def format_ip_ranges_for_pac(cidrs, minify=False):
+    """将 IPv4 网段格式化为 PAC 中供二分查找的 [起始地址数组, 结束地址数组]"""
+    starts, ends = merge_ip_ranges(cidrs)
+    return json.dumps([starts, ends], separators=json_separators(minify))
+
+def build_keyword_automaton(keywords):
+    """
+    将关键字集合构建为 Aho-Corasick 自动机，返回 (转移表, 失败指针, 输出标记) 三个按状态编号索引的列表，
+    状态 0 为根。输出标记已沿失败指针传递，任一状态的标记为 1 即表示已匹配到某个关键字，
+    因此对 host 只需扫描一遍，与关键字数量无关
+    """
+    goto, fail, out = [{}], [0], [0]
+    for keyword in sorted(keywords):
+        state = 0
+        for c in keyword:
+            if c not in goto[state]:
+                goto[state][c] = len(goto)
+                goto.append({})
+                fail.append(0)
+                out.append(0)
+            state = goto[state][c]
+        out[state] = 1
+    # 按广度优先顺序计算失败指针，根的子节点失败时回到根
+    queue = list(goto[0].values())
+    for state in queue:
+        for c, child in goto[state].items():
+            queue.append(child)
+            f = fail[state]
+            while f and c not in goto[f]:
+                f = fail[f]
+            fail[child] = goto[f].get(c, 0)
+            out[child] = out[child] or out[fail[child]]
+    return goto, fail, out
+
+def keyword_match(host, automaton):
+    """用 build_keyword_automaton 构建的自动机判断 host 是否包含任一关键字，与 PAC 中的 keywordMatch 一致"""
+    goto, fail, out = automaton
+    state = 0
+    for c in host:
+        while state and c not in goto[state]:
+            state = fail[state]
+        state = goto[state].get(c, 0)
+        if out[state]:
+            return True
+    return False
+
+def automaton_keywords(automaton):
+    """
+    从 build_keyword_automaton 构建的自动机还原关键字，按广度优先顺序返回。
+    包含其他关键字的关键字不影响匹配结果，在自动机中也无法与被包含的关键字区分，因此不会返回
+    """
+    goto, fail, out = automaton
+    keywords = []
+    # (状态, 从根到该状态的文本, 该文本是否已包含某个关键字)
+    queue = [(0, "", False)]
+    for state, text, covered in queue:
+        for c, child in goto[state].items():
+            # 输出标记来自失败指针时，说明文本的某个后缀是关键字
+            if out[child] and not covered and not out[fail[child]]:
+                keywords.append(text + c)
+            queue.append((child, text + c, covered or bool(out[child])))
+    return keywords
+
+def format_keywords_for_pac(keywords, minify=False):
+    """将关键字集合格式化为 PAC 中的 [转移表, 失败指针, 输出标记] 自动机，没有关键字时为 null"""
+    if not keywords:
+        return "null"
+    return json.dumps(build_keyword_automaton(keywords), ensure_ascii=False, separators=json_separators(minify))
+
+def format_regexes_for_pac(regexes, minify=False):
+    """将正则集合格式化为 PAC 中的正则文本数组，由 combineRegexRules 在加载时合并为一个正则"""
+    return json.dumps(sorted(regexes), ensure_ascii=False, separators=json_separators(minify))
+
+def read_host_profile(filename):
+    """
+    读取 host 访问记录，返回 {host: 访问次数}。每行可以是：
+    - "host 次数" 或 "次数 host"（如 sort | uniq -c 的输出）
+    - 访问日志记录、URL 或单独的 host，每行计 1 次
+    """
+    # pac_engine 依赖本模块，在函数内导入以避免循环导入
+    import pac_engine
+    profile = {}
+    with open(filename, "r", encoding="utf-8", errors="replace") as f:
+        for line in f:
+            fields = line.split()
+            if len(fields) == 2 and fields[1].isdigit() and not fields[0].isdigit():
+                host, count = fields[0], int(fields[1])
+            elif len(fields) == 2 and fields[0].isdigit():
+                host, count = fields[1], int(fields[0])
+            else:
+                host, count = pac_engine.extract_host(line), 1
+            if host:
+                host = host.lower()
+                profile[host] = profile.get(host, 0) + count
+    return profile
+
+def build_hot_hosts(rule_sets, profile, size=HOT_HOSTS_SIZE, label=""):
+    """
+    选出访问次数最多的 size 个 host，预先计算判定结果，返回 {host: "direct" | "proxy" | "default"}；
+    同时按访问分布估算 PAC 平均每次判定的查表次数（加入热点表前后），结果记入 rule_sets["stats"]
+    """
+    import pac_engine
+    if not profile or size <= 0:
+        return {}
+    rules = pac_engine.compile_rules(rule_sets)
+    ranked = sorted(profile.items(), key=lambda item: (-item[1], item[0]))[:size]
+    hot_hosts = {host: pac_engine.classify_host(host, rules) for host, _ in ranked}
+
+    total = sum(profile.values())
+    before = after = hot_total = 0
+    for host, count in profile.items():
+        probes = pac_engine.count_probes(host, rules)
+        before += count * probes
+        if host in hot_hosts:
+            after += count
+            hot_total += count
+        else:
+            after += count * (probes + 1)
+    stats = {
+        "hot_hosts": len(hot_hosts),
+        "hot_coverage": round(hot_total / total, 6),
+        "avg_probes_before": round(before / total, 4),
+        "avg_probes_after": round(after / total, 4)
+    }
+    print(f"{label}热点 host: {len(hot_hosts)} 个, 覆盖访问量 {stats['hot_coverage']:.1%}, "
+          f"平均查表次数 {stats['avg_probes_before']:.2f} -> {stats['avg_probes_after']:.2f}（按 {total} 次访问估算）")
+    rule_sets.setdefault("stats", {}).update(stats)
+    return hot_hosts
+
+def format_hot_hosts_for_pac(hot_hosts, minify=False):
+    """将热点 host 的判定结果格式化为 PAC 中的查找表 {host: 判定编码}"""
+    table = {host: HOT_DECISIONS[hot_hosts[host]] for host in sorted(hot_hosts)}
+    return json.dumps(table, ensure_ascii=False, separators=json_separators(minify))
+
 def check_duplicate_domains(china_domains, custom_domains):
     """检查自定义直连域名中哪些已经存在于中国域名列表中，并返回清理后的域名列表"""
     def check_duplicates_and_subdomains(custom_set, base_set, label):
         duplicates = []
-        clean_set = set(custom_set)
-        # 完全匹配
-        matched = custom_set & base_set
-        if matched:
-            duplicates.extend(list(matched))
-            clean_set -= matched
-        # 子域名匹配
-        for item in list(clean_set):
-            parts = item.split('.')
-            for i in range(1, len(parts)):
-                parent = '.'.join(parts[i:])
-                if parent in base_set:
-                    duplicates.append(f"{item} (子域名匹配: {parent})")
-                    clean_set.remove(item)
-                    break
-        return duplicates, clean_set
+        clean = []
+        # 一次归并同时找出完全匹配和子域名匹配（覆盖它的最近一级上级域名）
+        for item, parent in DomainIndex.of(custom_set).coverage(base_set):
+            if parent is None:
+                clean.append(item)
+            elif parent == item:
+                duplicates.append(item)
+            else:
+                duplicates.append(f"{item} (子域名匹配: {parent})")
+        return duplicates, DomainIndex(clean)
 
     duplicate_domains = []
-    clean_domains = {"suffixes": set(), "domains": set()}
+    clean_domains = {key: set(custom_domains.get(key, set())) for key in ("cidrs", "keywords", "regexes")}
 
     # 后缀匹配
     dups, clean = check_duplicates_and_subdomains(
@@ -156,13 +736,72 @@ def check_duplicate_domains(china_domains, custom_domains):
 
     return duplicate_domains, clean_domains
 
-def generate_pac(proxy=PROXY_SERVER, direct=DIRECT_RULE, default=DEFAULT_RULE, skip_download=False, check_duplicates=False, source="metacubex", output_name="proxy.pac"):
-    """生成 PAC 文件，区分后缀匹配和全字匹配域名"""
-    print("开始生成 PAC 文件...")
-    
-    # 确保配置和输出目录存在
+def count_domains(domain_dict):
+    """统计域名字典中后缀和全字匹配规则的总数"""
+    return len(domain_dict.get("suffixes", set())) + len(domain_dict.get("domains", set()))
+
+def formatted_size(domain_dict, minify=False):
+    """
+    计算域名字典以平铺编码写入 PAC 后占用的字节数，与 format_domain_lists_for_pac 的输出长度一致
+    （域名中没有需要在 JSON 中转义的字符），只用到 DomainIndex 的总字节数，不需要逐条格式化；
+    minify 与渲染时相同，决定分隔符是否带空格（见 json_separators）
+    """
+    # {"a": 1, "b": 1}：每条有两个引号和 ": 1" 共 5 个字节，条目之间为 ", "；精简时为 {"a":1,"b":1}
+    entry_bytes, separator_bytes = (4, 1) if minify else (5, 2)
+    size = 0
+    for key in DOMAIN_KEYS:
+        domains = DomainIndex.of(domain_dict.get(key, ()))
+        size += 2 + domains.text_bytes + entry_bytes * len(domains) + separator_bytes * max(len(domains) - 1, 0)
+    return size
+
+def minimize_domain_rules(direct_domains, proxy_domains):
+    """
+    精简直连和代理规则，移除不会影响任何 host 匹配结果的冗余项：
+    - 已被上级后缀覆盖的后缀，以及被某个后缀覆盖的全字匹配域名
+    - 已被代理规则覆盖的直连规则（代理规则优先判断，这些直连规则永远不会生效）
+    IP 段、关键字和正则规则原样保留。各步骤都是对 DomainIndex 的有序归并，不构建字典树或中间集合
+    """
+    proxy_suffixes = DomainIndex.of(proxy_domains.get("suffixes", ()))
+    # 被上级后缀覆盖的后缀去掉后，剩余后缀覆盖的域名范围不变
+    min_proxy_suffixes = proxy_suffixes.without_covered(proxy_suffixes, strict=True)
+    min_proxy = {
+        "suffixes": min_proxy_suffixes,
+        "domains": DomainIndex.of(proxy_domains.get("domains", ())).without_covered(min_proxy_suffixes),
+        "cidrs": set(proxy_domains.get("cidrs", set())),
+        "keywords": set(proxy_domains.get("keywords", set())),
+        "regexes": set(proxy_domains.get("regexes", set()))
+    }
+
+    direct_suffixes = DomainIndex.of(direct_domains.get("suffixes", ())).without_covered(min_proxy_suffixes)
+    min_direct_suffixes = direct_suffixes.without_covered(direct_suffixes, strict=True)
+    min_direct = {
+        "suffixes": min_direct_suffixes,
+        "domains": (
+            DomainIndex.of(direct_domains.get("domains", ()))
+            .difference(min_proxy["domains"])
+            .without_covered(min_proxy_suffixes)
+            .without_covered(min_direct_suffixes)
+        ),
+        "cidrs": set(direct_domains.get("cidrs", set())),
+        "keywords": set(direct_domains.get("keywords", set())),
+        "regexes": set(direct_domains.get("regexes", set()))
+    }
+
+    stats = {
+        "direct_pruned": count_domains(direct_domains) - count_domains(min_direct),
+        "proxy_pruned": count_domains(proxy_domains) - count_domains(min_proxy),
+        "bytes_saved": (formatted_size(direct_domains) + formatted_size(proxy_domains)
+                        - formatted_size(min_direct) - formatted_size(min_proxy))
+    }
+    return min_direct, min_proxy, stats
+
+def load_shared_inputs(sources, skip_download=False, cache_dir=CACHE_DIR, allow_missing=False):
+    """
+    并发下载局域网域名和各个中国域名列表来源，并读取自定义配置，供多个构建目标共用；
+    有来源无法获取时返回 None
+    """
+    # 确保配置目录存在
     ensure_dir(CONFIG_DIR)
-    ensure_dir(OUTPUT_DIR)
     
     # 创建默认的配置文件（如果不存在）
     direct_config = os.path.join(CONFIG_DIR, "direct.txt")
@@ -180,56 +819,144 @@ def generate_pac(proxy=PROXY_SERVER, direct=DIRECT_RULE, default=DEFAULT_RULE, s
             f.write("# 以 . 开头的域名（如 .example.com）视为后缀匹配\n")
             f.write("# 其他域名（如 example.com）视为全字匹配\n")
     
-    # 读取域名列表 - 先下载局域网域名，再下载中国域名
-    localarea_domains = download_localarea_domains(skip_download)
-    china_domains = download_china_domains(skip_download, source)
-    custom_direct_domains = read_domain_file(direct_config)
-    proxy_domains = read_domain_file(proxy_config)
+    # 读取域名列表 - 并发下载局域网域名和中国域名
+    with build_metrics.stage("download"):
+        downloaded = download_domain_lists(["localarea"] + list(sources), skip_download, cache_dir, allow_missing)
+    if downloaded is None:
+        return None
+    with build_metrics.stage("parse"):
+        custom_direct = read_domain_file(direct_config)
+        proxy = read_domain_file(proxy_config)
+    build_metrics.record("sources", "custom_direct", rule_counts(custom_direct))
+    build_metrics.record("sources", "proxy", rule_counts(proxy))
+    return {
+        "localarea": downloaded["localarea"],
+        "china": {source: downloaded[source] for source in sources},
+        "custom_direct": custom_direct,
+        "proxy": proxy
+    }
+
+def merge_rule_sets(inputs, source="metacubex", check_duplicates=False, minimize=True, label=""):
+    """
+    按来源合并共享输入，返回 PAC 使用的直连和代理规则集 {"direct": ..., "proxy": ..., "local": ..., "stats": ...}，
+    label 为输出信息的前缀，local 为已合并进直连规则的局域网规则（供 dnsmasq 等导出格式区分），stats 为各类规则的数量
+    """
+    localarea_domains = inputs["localarea"]
+    china_domains = inputs["china"][source]
+    custom_direct_domains = inputs["custom_direct"]
+    proxy_domains = inputs["proxy"]
+    removed_count = 0
     
     # 如果需要检查重复域名
     if check_duplicates:
-        duplicate_domains, clean_custom_direct_domains = check_duplicate_domains(china_domains, custom_direct_domains)
+        with build_metrics.stage("dedup"):
+            duplicate_domains, clean_custom_direct_domains = check_duplicate_domains(china_domains, custom_direct_domains)
         if duplicate_domains:
-            print("\n以下域名已存在于中国域名列表中，可以从 direct.txt 中移除：")
+            print(f"\n{label}以下域名已存在于中国域名列表中，可以从 direct.txt 中移除：")
             for domain in sorted(duplicate_domains):
                 print(f"- {domain}")
             print()
             
             # 使用去重后的域名数组替换原始域名数组
             custom_direct_domains = clean_custom_direct_domains
-            print(f"已自动移除重复域名数量: {len(duplicate_domains)}")
+            removed_count = len(duplicate_domains)
+            print(f"{label}已自动移除重复域名数量: {len(duplicate_domains)}")
     
     # 合并直连域名
-    direct_domains = {
-        "suffixes": set().union(
-            localarea_domains.get("suffixes", set()),
-            china_domains.get("suffixes", set()),
-            custom_direct_domains.get("suffixes", set())
-        ),
-        "domains": set().union(
-            localarea_domains.get("domains", set()),
-            china_domains.get("domains", set()),
-            custom_direct_domains.get("domains", set())
-        )
+    merge_start = time.perf_counter()
+    # 后缀和全字匹配域名按有序归并求并集，其余规则数量较少，直接合并 set
+    direct_domains = {}
+    for key in RULE_KEYS:
+        parts = [domains.get(key, ()) for domains in (localarea_domains, china_domains, custom_direct_domains)]
+        direct_domains[key] = DomainIndex.of(parts[0]).union(*parts[1:]) if key in DOMAIN_KEYS else set().union(*parts)
+    build_metrics.add_stage("merge", time.perf_counter() - merge_start)
+    stats = {
+        "localarea_count": count_domains(localarea_domains),
+        "china_count": count_domains(china_domains),
+        "custom_direct_count": count_domains(custom_direct_domains),
+        "direct_total": count_domains(direct_domains),
+        "proxy_total": count_domains(proxy_domains),
+        "removed_duplicates": removed_count,
+        "direct_cidrs": len(direct_domains["cidrs"]),
+        "proxy_cidrs": len(proxy_domains.get("cidrs", set())),
+        "direct_keywords": len(direct_domains["keywords"]),
+        "proxy_keywords": len(proxy_domains.get("keywords", set())),
+        "direct_regexes": len(direct_domains["regexes"]),
+        "proxy_regexes": len(proxy_domains.get("regexes", set()))
     }
     
-    print(f"局域网域名数量: {len(localarea_domains.get('suffixes', set())) + len(localarea_domains.get('domains', set()))}")
-    print(f"中国域名数量: {len(china_domains.get('suffixes', set())) + len(china_domains.get('domains', set()))}")
-    print(f"自定义直连域名数量: {len(custom_direct_domains.get('suffixes', set())) + len(custom_direct_domains.get('domains', set()))}")
-    print(f"直连域名总数: {len(direct_domains.get('suffixes', set())) + len(direct_domains.get('domains', set()))}")
-    print(f"代理域名总数: {len(proxy_domains.get('suffixes', set())) + len(proxy_domains.get('domains', set()))}")
+    print(f"{label}局域网域名数量: {count_domains(localarea_domains)}")
+    print(f"{label}中国域名数量: {count_domains(china_domains)}")
+    print(f"{label}自定义直连域名数量: {count_domains(custom_direct_domains)}")
+    print(f"{label}直连域名总数: {count_domains(direct_domains)}")
+    print(f"{label}代理域名总数: {count_domains(proxy_domains)}")
+    print(f"{label}直连 IP 段数量: {len(direct_domains['cidrs'])}, 代理 IP 段数量: {len(proxy_domains.get('cidrs', set()))}")
+    if stats["direct_keywords"] or stats["proxy_keywords"] or stats["direct_regexes"] or stats["proxy_regexes"]:
+        print(f"{label}关键字规则: 直连 {stats['direct_keywords']} 条, 代理 {stats['proxy_keywords']} 条; "
+              f"正则规则: 直连 {stats['direct_regexes']} 条, 代理 {stats['proxy_regexes']} 条")
     
-    # 读取 PAC 模板
-    try:
-        with open(PAC_TEMPLATE, 'r', encoding='utf-8') as f:
-            pac_template = f.read()
-    except Exception as e:
-        print(f"读取 PAC 模板失败: {e}")
-        return False
+    # 精简规则：移除被上级后缀或代理规则覆盖的冗余项
+    if minimize:
+        with build_metrics.stage("minimize"):
+            direct_domains, proxy_domains, minimize_stats = minimize_domain_rules(direct_domains, proxy_domains)
+        print(f"{label}规则精简: 移除直连规则 {minimize_stats['direct_pruned']} 条, 代理规则 {minimize_stats['proxy_pruned']} 条, 节省 {minimize_stats['bytes_saved']} 字节")
+        stats.update(minimize_stats)
+    build_metrics.record("rule_sets", source, stats)
+
+    return {"direct": direct_domains, "proxy": proxy_domains, "local": localarea_domains, "stats": stats}
+
+def build_rule_sets(skip_download=False, check_duplicates=False, source="metacubex", minimize=True, cache_dir=CACHE_DIR, allow_missing=False):
+    """
+    下载并合并各来源的域名列表，返回 PAC 使用的直连和代理规则集 {"direct": ..., "proxy": ...}，
+    有来源无法获取时返回 None
+    """
+    inputs = load_shared_inputs([source], skip_download, cache_dir, allow_missing)
+    if inputs is None:
+        return None
+    return merge_rule_sets(inputs, source, check_duplicates, minimize)
+
+def render_options_with_defaults(options=None):
+    """补全 PAC 渲染选项（encoding、decision_cache）中未指定的项"""
+    return dict(DEFAULT_RENDER_OPTIONS, **(options or {}))
+
+def minify_pac_template(pac_template):
+    """
+    精简 PAC 模板：去掉独占一行的 // 注释和 /* */ 注释、行首缩进和空行。
+    模板中的注释都独占一行，行尾注释和代码中的字符串、正则不会被改动；
+    保留换行，不依赖分号自动插入以外的任何语法假设。
+    """
+    lines = []
+    in_block_comment = False
+    for line in pac_template.splitlines():
+        stripped = line.strip()
+        if in_block_comment:
+            in_block_comment = "*/" not in stripped
+            continue
+        if not stripped or stripped.startswith("//"):
+            continue
+        if stripped.startswith("/*"):
+            in_block_comment = "*/" not in stripped
+            continue
+        lines.append(stripped)
+    return "\n".join(lines) + "\n"
+
+def render_pac(pac_template, rule_sets, proxy=PROXY_SERVER, direct=DIRECT_RULE, default=DEFAULT_RULE, options=None, label="", report=True):
+    """将规则集和代理规则填入 PAC 模板，返回 PAC 文件内容，options 为渲染选项，report 为 False 时不输出统计"""
+    options = render_options_with_defaults(options)
+    encoding = options["encoding"]
+    minify = options["minify"]
+    direct_domains = rule_sets["direct"]
+    proxy_domains = rule_sets["proxy"]
+    if minify:
+        pac_template = minify_pac_template(pac_template)
     
     # 使用新的格式化函数处理域名列表
-    formatted_direct_domains = format_domain_lists_for_pac(direct_domains, localarea_domains)
-    formatted_proxy_domains = format_domain_lists_for_pac(proxy_domains)
+    formatted_direct_domains = format_domain_lists_for_pac(direct_domains, encoding=encoding, minify=minify)
+    formatted_proxy_domains = format_domain_lists_for_pac(proxy_domains, encoding=encoding, minify=minify)
+    if encoding != "flat" and report:
+        flat_size = formatted_size(direct_domains, minify) + formatted_size(proxy_domains, minify)
+        encoded_size = sum(len(value.encode("utf-8")) for formatted in (formatted_direct_domains, formatted_proxy_domains) for value in formatted.values())
+        print(f"{label}域名表编码 {encoding}: {encoded_size} 字节, 平铺编码 {flat_size} 字节, 减少 {flat_size - encoded_size} 字节 ({(flat_size - encoded_size) * 100 / max(flat_size, 1):.1f}%)")
     
     # 替换模板中的占位符
     pac_content = pac_template
@@ -239,22 +966,721 @@ def generate_pac(proxy=PROXY_SERVER, direct=DIRECT_RULE, default=DEFAULT_RULE, s
     pac_content = pac_content.replace("__DIRECT_DOMAIN_EXACTS__", formatted_direct_domains["domains"])
     pac_content = pac_content.replace("__PROXY_DOMAIN_SUFFIXES__", formatted_proxy_domains["suffixes"])
     pac_content = pac_content.replace("__PROXY_DOMAIN_EXACTS__", formatted_proxy_domains["domains"])
+    pac_content = pac_content.replace("__DIRECT_IP_RANGES__", format_ip_ranges_for_pac(direct_domains.get("cidrs", set()), minify))
+    pac_content = pac_content.replace("__PROXY_IP_RANGES__", format_ip_ranges_for_pac(proxy_domains.get("cidrs", set()), minify))
+    pac_content = pac_content.replace("__DIRECT_DOMAIN_KEYWORDS__", format_keywords_for_pac(direct_domains.get("keywords", set()), minify))
+    pac_content = pac_content.replace("__PROXY_DOMAIN_KEYWORDS__", format_keywords_for_pac(proxy_domains.get("keywords", set()), minify))
+    pac_content = pac_content.replace("__DIRECT_DOMAIN_REGEXES__", format_regexes_for_pac(direct_domains.get("regexes", set()), minify))
+    pac_content = pac_content.replace("__PROXY_DOMAIN_REGEXES__", format_regexes_for_pac(proxy_domains.get("regexes", set()), minify))
+    pac_content = pac_content.replace("__HOT_HOSTS__", format_hot_hosts_for_pac(rule_sets.get("hot_hosts", {}), minify))
+    pac_content = pac_content.replace("__DECISION_CACHE_SIZE__", str(max(int(options["decision_cache"]), 0)))
     
     # 替换其他占位符
     pac_content = pac_content.replace("{proxy}", proxy)
     pac_content = pac_content.replace("{direct}", direct)
     pac_content = pac_content.replace("{default}", default)
+    return pac_content
+
+def compressed_variants():
+    """返回 --compress 生成的压缩格式 [(扩展名, 压缩函数)]，均使用最高压缩等级"""
+    variants = [(".gz", lambda data: gzip.compress(data, compresslevel=9, mtime=0))]
+    if brotli is not None:
+        variants.append((".br", lambda data: brotli.compress(data, quality=11, mode=brotli.MODE_TEXT)))
+    elif zstandard is not None:
+        variants.append((".zst", lambda data: zstandard.ZstdCompressor(level=22).compress(data)))
+    return variants
+
+def target_output_files(target, options=None):
+    """返回构建目标生成的所有文件路径（PAC 文件及预压缩文件、其他格式的规则文件）"""
+    options = render_options_with_defaults(options)
+    output_file = os.path.join(OUTPUT_DIR, target["output"])
+    files = []
+    for name in options["formats"]:
+        if name == "pac":
+            files.append(output_file)
+            if options["compress"]:
+                files.extend(output_file + ext for ext, _ in compressed_variants())
+        else:
+            files.extend(export_file_name(target, suffix) for suffix in EMITTERS[name][0])
+    return files
+
+def write_pac_target(pac_template, rule_sets, target, options=None, label=""):
+    """
+    渲染并写入单个构建目标的 PAC 文件（以及预压缩文件），失败返回 None，成功时返回
+    {"sha256": 文件内容摘要, "sizes": {"bytes", "raw_bytes", ".gz", ...}, "format_seconds", "write_seconds", "peak_rss_kb"}；
+    在进程池中执行时由主进程汇总耗时和大小
+    """
+    options = render_options_with_defaults(options)
+    start = time.perf_counter()
+    pac_content = render_pac(pac_template, rule_sets, target["proxy"], target["direct"], target["default"], options, label)
+    pac_bytes = pac_content.encode("utf-8")
+    sizes = {"bytes": len(pac_bytes)}
+    if options["minify"]:
+        raw_content = render_pac(pac_template, rule_sets, target["proxy"], target["direct"], target["default"], dict(options, minify=False), label, report=False)
+        sizes["raw_bytes"] = len(raw_content.encode("utf-8"))
+    format_seconds = time.perf_counter() - start
     
     # 写入 PAC 文件
-    output_file = os.path.join(OUTPUT_DIR, output_name)
+    start = time.perf_counter()
+    output_file = os.path.join(OUTPUT_DIR, target["output"])
     try:
-        with open(output_file, 'w', encoding='utf-8') as f:
-            f.write(pac_content)
-        print(f"PAC 文件已生成: {output_file}")
-        return True
+        if options["compress"]:
+            # 先替换预压缩文件再替换 PAC 文件，pac_server 按 PAC 文件的变化重新加载时预压缩文件已是新内容
+            for ext, compress in compressed_variants():
+                compressed = compress(pac_bytes)
+                write_file_atomic(output_file + ext, compressed)
+                sizes[ext] = len(compressed)
+        write_file_atomic(output_file, pac_bytes)
+    except Exception as e:
+        print(f"{label}写入 PAC 文件失败: {e}")
+        return None
+    
+    if options["minify"]:
+        raw_size = sizes["raw_bytes"]
+        size_report = [f"原始 {raw_size} 字节", f"精简后 {len(pac_bytes)} 字节 (-{(raw_size - len(pac_bytes)) * 100 / max(raw_size, 1):.1f}%)"]
+    else:
+        size_report = [f"{len(pac_bytes)} 字节"]
+    size_report.extend(f"{key[1:]} {value} 字节" for key, value in sizes.items() if key.startswith("."))
+    print(f"{label}PAC 文件已生成: {output_file}")
+    print(f"{label}PAC 文件大小: {', '.join(size_report)}")
+    return {
+        "sha256": hashlib.sha256(pac_bytes).hexdigest(),
+        "sizes": sizes,
+        "format_seconds": format_seconds,
+        "write_seconds": time.perf_counter() - start,
+        "peak_rss_kb": build_metrics.peak_rss_kb()
+    }
+
+def rule_lines(domain_dict, suffix_prefix, domain_prefix, cidr_prefix=None, keyword_prefix=None, regex_prefix=None):
+    """
+    按后缀、全字匹配、IP 段、关键字、正则的顺序生成带前缀的规则行，各类规则内部排序，保证输出稳定；
+    前缀为 None 的规则类型不输出
+    """
+    lines = [f"{suffix_prefix}{domain}" for domain in sorted(domain_dict.get("suffixes", set()))]
+    lines.extend(f"{domain_prefix}{domain}" for domain in sorted(domain_dict.get("domains", set())))
+    if cidr_prefix is not None:
+        lines.extend(f"{cidr_prefix}{cidr}" for cidr in sorted(domain_dict.get("cidrs", set()), key=ipaddress.ip_network))
+    if keyword_prefix is not None:
+        lines.extend(f"{keyword_prefix}{keyword}" for keyword in sorted(domain_dict.get("keywords", set())))
+    if regex_prefix is not None:
+        lines.extend(f"{regex_prefix}{regex}" for regex in sorted(domain_dict.get("regexes", set())))
+    return lines
+
+def render_clash_rules(rule_sets, target, options):
+    """Clash rule-provider（behavior: classical）格式，直连和代理规则各一个文件"""
+    files = {}
+    for kind in ("direct", "proxy"):
+        lines = [f"# {kind} rules for {target['output']} (source: {target['source']})", "payload:"]
+        rules = rule_lines(rule_sets[kind], "DOMAIN-SUFFIX,", "DOMAIN,", "IP-CIDR,", "DOMAIN-KEYWORD,", "DOMAIN-REGEX,")
+        # YAML 单引号字符串中的单引号需要写成两个（正则中可能出现）
+        lines.extend("  - '{}'".format(line.replace("'", "''")) for line in rules)
+        files[f".clash-{kind}.yaml"] = ("\n".join(lines) + "\n").encode("utf-8")
+    return files
+
+def render_dnsmasq_conf(rule_sets, target, options):
+    """
+    dnsmasq 配置：直连域名交给 DNSMASQ_DIRECT_SERVER，代理域名交给 DNSMASQ_PROXY_SERVER。
+    局域网规则（rule_sets["local"]）及其子域名不转发给公共 DNS，输出为 local=/域名/，只由本机的 hosts 和 DHCP 解析。
+    dnsmasq 的 server=/域名/ 总是同时匹配子域名，全字匹配规则也会覆盖其子域名；
+    IP 段、关键字和正则规则 dnsmasq 不支持，不会输出
+    """
+    local = rule_sets.get("local", {})
+    local_domains = DomainIndex.of(local.get("suffixes", ())).union(local.get("domains", ()))
+    lines = [f"# dnsmasq rules for {target['output']} (source: {target['source']})"]
+    lines.extend(f"local=/{domain}/" for domain in sorted(local_domains))
+    for kind, server in (("direct", DNSMASQ_DIRECT_SERVER), ("proxy", DNSMASQ_PROXY_SERVER)):
+        domains = DomainIndex.of(rule_sets[kind].get("suffixes", ())).union(rule_sets[kind].get("domains", ()))
+        lines.extend(f"server=/{domain}/{server}" for domain in sorted(domains.without_covered(local_domains)))
+    return {".dnsmasq.conf": ("\n".join(lines) + "\n").encode("utf-8")}
+
+def render_singbox_rule_sets(rule_sets, target, options):
+    """sing-box 源格式规则集（version 1），直连和代理规则各一个文件"""
+    files = {}
+    for kind in ("direct", "proxy"):
+        domain_dict = rule_sets[kind]
+        rule = {
+            "domain": sorted(domain_dict.get("domains", set())),
+            "domain_suffix": sorted(domain_dict.get("suffixes", set())),
+            "domain_keyword": sorted(domain_dict.get("keywords", set())),
+            "domain_regex": sorted(domain_dict.get("regexes", set())),
+            "ip_cidr": sorted(domain_dict.get("cidrs", set()), key=ipaddress.ip_network)
+        }
+        rule = {key: value for key, value in rule.items() if value}
+        content = {"version": 1, "rules": [rule] if rule else []}
+        files[f".sing-box-{kind}.json"] = json.dumps(content, ensure_ascii=False, separators=json_separators(options["minify"])).encode("utf-8")
+    return files
+
+def write_varint(out, value):
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+def read_varint(data, pos):
+    value = shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, pos
+        shift += 7
+
+def write_string_table(out, strings):
+    """写入字符串表：条数，然后按排序后与前一条的公共前缀长度做前缀压缩（公共长度、剩余长度均为 varint）"""
+    entries = sorted(string.encode("utf-8") for string in strings)
+    write_varint(out, len(entries))
+    previous = b""
+    for entry in entries:
+        shared = 0
+        limit = min(len(previous), len(entry))
+        while shared < limit and previous[shared] == entry[shared]:
+            shared += 1
+        write_varint(out, shared)
+        write_varint(out, len(entry) - shared)
+        out += entry[shared:]
+        previous = entry
+
+def read_string_table(data, pos):
+    """读取 write_string_table 写入的字符串表，返回 (字符串集合, 新位置)"""
+    strings = set()
+    count, pos = read_varint(data, pos)
+    previous = b""
+    for _ in range(count):
+        shared, pos = read_varint(data, pos)
+        length, pos = read_varint(data, pos)
+        previous = previous[:shared] + data[pos:pos + length]
+        pos += length
+        strings.add(previous.decode("utf-8"))
+    return strings, pos
+
+def render_binary_rules(rule_sets, target, options):
+    """
+    紧凑二进制规则文件：RULE_BINARY_MAGIC + 版本号（1 字节）+ zlib 压缩的正文。
+    正文依次为直连和代理规则的后缀表、全字匹配表（前缀压缩的字符串表，见 write_string_table）、
+    合并后的 IP 区间（起始地址与上一区间结束地址的差值、区间长度，均为 varint）
+    以及关键字表、正则表（版本 2 起），由 read_binary_rules 读取
+    """
+    out = bytearray()
+    for kind in ("direct", "proxy"):
+        domain_dict = rule_sets[kind]
+        for key in ("suffixes", "domains"):
+            write_string_table(out, domain_dict.get(key, set()))
+        starts, ends = merge_ip_ranges(domain_dict.get("cidrs", set()))
+        write_varint(out, len(starts))
+        last = 0
+        for start, end in zip(starts, ends):
+            write_varint(out, start - last)
+            write_varint(out, end - start)
+            last = end
+        for key in ("keywords", "regexes"):
+            write_string_table(out, domain_dict.get(key, set()))
+    header = RULE_BINARY_MAGIC + struct.pack("B", RULE_BINARY_VERSION)
+    return {".rules.bin": header + zlib.compress(bytes(out), 9)}
+
+def read_binary_rules(data):
+    """读取 render_binary_rules 生成的二进制规则，返回 {"direct": 规则字典, "proxy": 规则字典}，IP 段还原为最少的 CIDR"""
+    if data[:4] != RULE_BINARY_MAGIC or not 1 <= data[4] <= RULE_BINARY_VERSION:
+        raise ValueError("不是支持的二进制规则文件")
+    version = data[4]
+    body = zlib.decompress(data[5:])
+    pos = 0
+    rule_sets = {}
+    for kind in ("direct", "proxy"):
+        domain_dict = empty_rules()
+        for key in ("suffixes", "domains"):
+            domain_dict[key], pos = read_string_table(body, pos)
+        count, pos = read_varint(body, pos)
+        starts, ends = [], []
+        last = 0
+        for _ in range(count):
+            delta, pos = read_varint(body, pos)
+            size, pos = read_varint(body, pos)
+            starts.append(last + delta)
+            last = starts[-1] + size
+            ends.append(last)
+        domain_dict["cidrs"] = ranges_to_cidrs(starts, ends)
+        if version >= 2:
+            for key in ("keywords", "regexes"):
+                domain_dict[key], pos = read_string_table(body, pos)
+        rule_sets[kind] = compact_rules(domain_dict)
+    return rule_sets
+
+# PAC 中保存规则的变量: 变量名 -> (规则集, 规则类型)，与 pac-template 一致
+PAC_RULE_VARIABLES = {
+    "directDomainSuffixes": ("direct", "suffixes"),
+    "directDomainExacts": ("direct", "domains"),
+    "proxyDomainSuffixes": ("proxy", "suffixes"),
+    "proxyDomainExacts": ("proxy", "domains"),
+    "directDomainKeywords": ("direct", "keywords"),
+    "proxyDomainKeywords": ("proxy", "keywords"),
+    "directDomainRegex": ("direct", "regexes"),
+    "proxyDomainRegex": ("proxy", "regexes"),
+    "directIpRanges": ("direct", "cidrs"),
+    "proxyIpRanges": ("proxy", "cidrs")
+}
+PAC_VARIABLE_PATTERN = re.compile(r"^var (\w+) = (.*);$", re.MULTILINE)
+
+def parse_pac_rule_value(key, value):
+    """将 PAC 中一个规则变量的值（render_pac 填入的字面量）还原为规则列表"""
+    if key in DOMAIN_KEYS:
+        if value.startswith("decodeDomainTrie(") and value.endswith(")"):
+            return decode_domain_trie(json.loads(value[len("decodeDomainTrie("):-1]))
+        return list(json.loads(value))
+    if key == "keywords":
+        automaton = json.loads(value)
+        return automaton_keywords(automaton) if automaton else []
+    if key == "regexes":
+        if not (value.startswith("combineRegexRules(") and value.endswith(")")):
+            raise ValueError(f"无法识别的正则规则: {value[:40]}")
+        return json.loads(value[len("combineRegexRules("):-1])
+    return ranges_to_cidrs(*json.loads(value))
+
+def read_pac_rules(pac_content):
+    """
+    从 render_pac 生成的 PAC 文件（含 --minify、--encoding trie）中读取规则，
+    返回 {"direct": 规则字典, "proxy": 规则字典}；IP 段还原为最少的 CIDR，
+    关键字由自动机还原（见 automaton_keywords）。热点 host 表由同一份规则计算，不单独读取
+    """
+    variables = dict(PAC_VARIABLE_PATTERN.findall(pac_content))
+    missing = [name for name, (_, key) in PAC_RULE_VARIABLES.items() if key in DOMAIN_KEYS and name not in variables]
+    if missing:
+        raise ValueError(f"不是本工具生成的 PAC 文件，缺少变量: {', '.join(missing)}")
+    rule_sets = {"direct": {}, "proxy": {}}
+    for name, (kind, key) in PAC_RULE_VARIABLES.items():
+        # 旧版本模板中没有 IP 段、关键字和正则变量，视为没有这些规则
+        if name in variables:
+            rule_sets[kind][key] = parse_pac_rule_value(key, variables[name])
+    return {kind: compact_rules(domain_dict) for kind, domain_dict in rule_sets.items()}
+
+def read_rule_snapshot(filename):
+    """读取以前生成的 PAC 文件或二进制规则文件（--formats binary），返回 {"direct": 规则字典, "proxy": 规则字典}"""
+    with open(filename, "rb") as f:
+        data = f.read()
+    if data.startswith(RULE_BINARY_MAGIC):
+        return read_binary_rules(data)
+    return read_pac_rules(data.decode("utf-8"))
+
+def comparable_rules(domain_dict):
+    """
+    将规则字典转换为可比较的形式：IP 段合并为最少的 CIDR，关键字去掉包含其他关键字的冗余项，
+    与从 PAC 文件读取的规则一致，比较结果只反映会影响匹配的变化
+    """
+    rules = compact_rules(domain_dict)
+    rules["cidrs"] = ranges_to_cidrs(*merge_ip_ranges(rules["cidrs"]))
+    rules["keywords"] = set(automaton_keywords(build_keyword_automaton(rules["keywords"]))) if rules["keywords"] else set()
+    return rules
+
+def diff_rule_sets(old_rule_sets, new_rule_sets):
+    """
+    比较两份规则集，返回 {"direct"/"proxy": {规则类型: {"added": [...], "removed": [...]}}}。
+    后缀和全字匹配域名对有序的 DomainIndex 做归并差集，耗时与条目数成线性，
+    结果按键的顺序排列（同一上级域名下的条目相邻）；其余规则按文本排序
+    """
+    diff = {}
+    for kind in ("direct", "proxy"):
+        old_rules = comparable_rules(old_rule_sets[kind])
+        new_rules = comparable_rules(new_rule_sets[kind])
+        diff[kind] = {}
+        for key in RULE_KEYS:
+            if key in DOMAIN_KEYS:
+                added, removed = list(new_rules[key] - old_rules[key]), list(old_rules[key] - new_rules[key])
+            else:
+                added, removed = sorted(new_rules[key] - old_rules[key]), sorted(old_rules[key] - new_rules[key])
+            diff[kind][key] = {"added": added, "removed": removed}
+    return diff
+
+# 规则导出格式: 名称 -> (输出文件名后缀, 渲染函数)。渲染函数接收 (rule_sets, target, options)，
+# 返回 {文件名后缀: 内容}，输出文件名为构建目标的文件名去掉扩展名后加上后缀。
+# "pac" 格式由 write_pac_target 处理。新增格式只需在这里注册渲染函数。
+EMITTERS = {
+    "clash": ((".clash-direct.yaml", ".clash-proxy.yaml"), render_clash_rules),
+    "dnsmasq": ((".dnsmasq.conf",), render_dnsmasq_conf),
+    "singbox": ((".sing-box-direct.json", ".sing-box-proxy.json"), render_singbox_rule_sets),
+    "binary": ((".rules.bin",), render_binary_rules)
+}
+OUTPUT_FORMATS = ["pac"] + list(EMITTERS)
+
+def export_file_name(target, suffix):
+    """返回构建目标某种导出格式的文件路径，如 output/proxy-metacubex.clash-direct.yaml"""
+    return os.path.join(OUTPUT_DIR, os.path.splitext(target["output"])[0] + suffix)
+
+def write_rule_export(name, rule_sets, target, options=None, label=""):
+    """渲染并写入构建目标的一种导出格式，返回值与 write_pac_target 相同，失败返回 None"""
+    options = render_options_with_defaults(options)
+    start = time.perf_counter()
+    files = EMITTERS[name][1](rule_sets, target, options)
+    format_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    digest = hashlib.sha256()
+    sizes = {}
+    try:
+        for suffix, content in sorted(files.items()):
+            write_file_atomic(export_file_name(target, suffix), content)
+            digest.update(suffix.encode("utf-8") + b"\0" + content)
+            sizes[suffix] = len(content)
     except Exception as e:
-        print(f"写入 PAC 文件失败: {e}")
+        print(f"{label}写入 {name} 规则失败: {e}")
+        return None
+    print(f"{label}{name} 规则已生成: {', '.join(f'{export_file_name(target, suffix)} ({size} 字节)' for suffix, size in sizes.items())}")
+    return {
+        "sha256": digest.hexdigest(),
+        "sizes": sizes,
+        "format_seconds": format_seconds,
+        "write_seconds": time.perf_counter() - start,
+        "peak_rss_kb": build_metrics.peak_rss_kb()
+    }
+
+def make_target(source="metacubex", output=None, proxy=PROXY_SERVER, direct=DIRECT_RULE, default=DEFAULT_RULE):
+    """创建构建目标，未指定输出文件名时使用 proxy-<来源>.pac"""
+    return {
+        "source": source,
+        "output": output or f"proxy-{source}.pac",
+        "proxy": proxy,
+        "direct": direct,
+        "default": default
+    }
+
+def read_targets_file(filename, proxy=PROXY_SERVER, direct=DIRECT_RULE, default=DEFAULT_RULE):
+    """读取 JSON 格式的构建目标列表，目标中未指定的 proxy/direct/default 使用命令行中的值"""
+    with open(filename, "r", encoding="utf-8") as f:
+        entries = json.load(f)
+    targets = []
+    for entry in entries:
+        source = entry.get("source", "metacubex")
+        if source not in ("acl4ssr", "metacubex"):
+            raise ValueError(f"构建目标的 source 必须为 acl4ssr 或 metacubex: {source}")
+        targets.append(make_target(
+            source,
+            entry.get("output"),
+            entry.get("proxy", proxy),
+            entry.get("direct", direct),
+            entry.get("default", default)
+        ))
+    return targets
+
+def file_digest(filename):
+    """计算文件内容的 SHA-256，文件不存在时返回空字符串"""
+    if not os.path.exists(filename):
+        return ""
+    digest = hashlib.sha256()
+    with open(filename, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def generator_digest():
+    """计算影响输出的所有模块和 PAC 模板的组合摘要，任一文件变化都会使所有目标重新生成"""
+    module_dir = os.path.dirname(os.path.abspath(__file__))
+    files = [os.path.join(module_dir, name) for name in GENERATOR_MODULES] + [PAC_TEMPLATE]
+    digest = hashlib.sha256()
+    for filename in files:
+        digest.update(f"{os.path.basename(filename)}\0{file_digest(filename)}\n".encode("utf-8"))
+    return digest.hexdigest()
+
+def domain_set_digest(domain_dict):
+    """计算域名字典内容的 SHA-256，与集合的迭代顺序无关"""
+    digest = hashlib.sha256()
+    for key in RULE_KEYS:
+        for domain in sorted(domain_dict.get(key, set())):
+            digest.update(domain.encode("utf-8") + b"\n")
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+def target_digest(target, input_digests, options):
+    """计算单个构建目标的所有输入（共享输入、该目标的来源、目标配置和生成选项）的摘要"""
+    payload = {
+        "shared": input_digests["shared"],
+        "source": input_digests["sources"][target["source"]],
+        "target": target,
+        "options": options
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode("utf-8")).hexdigest()
+
+def load_build_manifest():
+    """读取上次构建的清单 {输出文件名: {"inputs": 输入摘要, "sha256": 输出摘要}}"""
+    try:
+        with open(os.path.join(OUTPUT_DIR, BUILD_MANIFEST), "r", encoding="utf-8") as f:
+            return json.load(f).get("targets", {})
+    except (OSError, ValueError):
+        return {}
+
+def save_build_manifest(manifest, changed):
+    """保存构建清单，changed 为本次内容发生变化的输出文件"""
+    content = json.dumps({
+        "generated_at": datetime.now().isoformat(timespec="seconds"),
+        "changed": changed,
+        "targets": manifest
+    }, ensure_ascii=False, indent=2, sort_keys=True)
+    write_file_atomic(os.path.join(OUTPUT_DIR, BUILD_MANIFEST), content.encode("utf-8"))
+
+def report_build_changes(changed, github_output=None):
+    """
+    输出本次构建是否产生了新内容；github_output 为 $GITHUB_OUTPUT 文件时同时写入，供后续步骤决定是否发布。
+    只有命令行构建传入 github_output，基准测试和 pac_server 调用 generate_pac_targets 时不会写入
+    """
+    print(f"BUILD_CHANGED={'true' if changed else 'false'}")
+    print(f"BUILD_CHANGED_OUTPUTS={','.join(changed)}")
+    if github_output:
+        with open(github_output, "a", encoding="utf-8") as f:
+            f.write(f"changed={'true' if changed else 'false'}\n")
+            f.write(f"changed_outputs={','.join(changed)}\n")
+
+def generate_pac_targets(targets, skip_download=False, check_duplicates=False, minimize=True, cache_dir=CACHE_DIR, force=False, options=None, allow_missing=False, github_output=None):
+    """
+    一次生成多个 PAC 文件：共享输入只下载和解析一次，每个来源只合并一次，
+    各目标的渲染和写入在进程池中并行执行。options 为 PAC 渲染选项（见 DEFAULT_RENDER_OPTIONS）。
+
+    构建清单记录每个目标所有输入的摘要，输入未变化且输出文件存在的目标不会重新渲染；
+    force 为 True 时忽略清单全部重新生成。
+    有来源既没有下载成功也没有缓存快照时不写入任何文件，返回 False；
+    allow_missing 为 True 时（只用于 --skip-download 的本地调试）按空列表继续生成；
+    github_output 传给 report_build_changes。
+    """
+    print("开始生成 PAC 文件...")
+    
+    # 确保输出目录存在
+    ensure_dir(OUTPUT_DIR)
+    
+    sources = list(dict.fromkeys(target["source"] for target in targets))
+    multiple = len(targets) > 1
+    inputs = load_shared_inputs(sources, skip_download, cache_dir, allow_missing)
+    if inputs is None:
+        print("缺少上游域名列表，不生成任何文件")
+        return False
+    
+    # 读取 PAC 模板
+    try:
+        with open(PAC_TEMPLATE, 'r', encoding='utf-8') as f:
+            pac_template = f.read()
+    except Exception as e:
+        print(f"读取 PAC 模板失败: {e}")
         return False
+    
+    # 计算各目标的输入摘要，只重新生成输入发生变化的目标
+    options = render_options_with_defaults(options)
+    input_digests = {
+        "shared": {
+            "generator": generator_digest(),
+            "template": hashlib.sha256(pac_template.encode("utf-8")).hexdigest(),
+            "direct_config": file_digest(os.path.join(CONFIG_DIR, "direct.txt")),
+            "proxy_config": file_digest(os.path.join(CONFIG_DIR, "proxy.txt")),
+            "localarea": domain_set_digest(inputs["localarea"]),
+            "host_profile": file_digest(options["host_profile"]) if options["host_profile"] else ""
+        },
+        "sources": {source: domain_set_digest(inputs["china"][source]) for source in sources}
+    }
+    build_options = dict(options, check_duplicates=check_duplicates, minimize=minimize)
+    manifest = load_build_manifest()
+    digests = {target["output"]: target_digest(target, input_digests, build_options) for target in targets}
+    pending = [
+        target for target in targets
+        if force
+        or manifest.get(target["output"], {}).get("inputs") != digests[target["output"]]
+        or not all(os.path.exists(output_file) for output_file in target_output_files(target, options))
+    ]
+    for target in targets:
+        if target not in pending:
+            print(f"输入未变化，跳过生成: {target['output']}")
+            # 跳过的目标使用上次构建记录的统计，指标文件中的数据仍然完整
+            previous = manifest[target["output"]]
+            build_metrics.record("rule_sets", target["source"], previous.get("stats", {}))
+            build_metrics.record("outputs", target["output"], {"skipped": True, "sha256": previous.get("sha256"), "sizes": previous.get("sizes", {})})
+    if not pending:
+        report_build_changes([], github_output)
+        return True
+    
+    pending_sources = list(dict.fromkeys(target["source"] for target in pending))
+    rule_sets = {
+        source: merge_rule_sets(inputs, source, check_duplicates, minimize, f"[{source}] " if multiple else "")
+        for source in pending_sources
+    }
+    
+    # 根据访问记录为每个来源的规则集生成热点 host 表
+    if options["host_profile"]:
+        try:
+            profile = read_host_profile(options["host_profile"])
+        except OSError as e:
+            print(f"读取访问记录失败: {e}")
+            return False
+        print(f"从 {options['host_profile']} 读取了 {len(profile)} 个 host 的访问记录")
+        for source, source_rule_sets in rule_sets.items():
+            source_rule_sets["hot_hosts"] = build_hot_hosts(source_rule_sets, profile, options["hot_hosts"], f"[{source}] " if multiple else "")
+            build_metrics.record("rule_sets", source, source_rule_sets["stats"])
+    
+    # 每个目标的每种输出格式是一个任务，全部在进程池中并行执行
+    jobs = []
+    for target in pending:
+        label = f"[{target['output']}] " if multiple else ""
+        for name in options["formats"]:
+            if name == "pac":
+                jobs.append((target, write_pac_target, (pac_template, rule_sets[target["source"]], target, options, label)))
+            else:
+                jobs.append((target, write_rule_export, (name, rule_sets[target["source"]], target, options, label)))
+    if len(jobs) == 1:
+        job_results = [jobs[0][1](*jobs[0][2])]
+    else:
+        with ProcessPoolExecutor(max_workers=min(len(jobs), os.cpu_count() or 1)) as executor:
+            futures = [executor.submit(func, *args) for _, func, args in jobs]
+            job_results = [future.result() for future in futures]
+    
+    # 合并同一目标各格式的结果，只有一种格式时摘要即该格式的摘要
+    target_results = {target["output"]: [] for target in pending}
+    for (target, _, _), result in zip(jobs, job_results):
+        target_results[target["output"]].append(result)
+    results = []
+    for target in pending:
+        parts = target_results[target["output"]]
+        if any(part is None for part in parts):
+            results.append(None)
+            continue
+        sizes = {}
+        for part in parts:
+            sizes.update(part["sizes"])
+        results.append({
+            "sha256": parts[0]["sha256"] if len(parts) == 1 else hashlib.sha256("".join(part["sha256"] for part in parts).encode("utf-8")).hexdigest(),
+            "sizes": sizes,
+            "format_seconds": sum(part["format_seconds"] for part in parts),
+            "write_seconds": sum(part["write_seconds"] for part in parts),
+            "peak_rss_kb": max((part["peak_rss_kb"] or 0) for part in parts)
+        })
+    
+    # 更新构建清单，内容与上次不同的输出才算发生变化
+    changed = []
+    for target, result in zip(pending, results):
+        if result is None:
+            continue
+        build_metrics.add_stage("format", result["format_seconds"], peak_rss=result["peak_rss_kb"])
+        build_metrics.add_stage("write", result["write_seconds"], peak_rss=result["peak_rss_kb"])
+        build_metrics.record("outputs", target["output"], {"skipped": False, "sha256": result["sha256"], "sizes": result["sizes"]})
+        previous = manifest.get(target["output"], {})
+        if previous.get("sha256") != result["sha256"]:
+            changed.append(target["output"])
+        manifest[target["output"]] = {
+            "inputs": digests[target["output"]],
+            "sha256": result["sha256"],
+            "sizes": result["sizes"],
+            "stats": rule_sets[target["source"]]["stats"]
+        }
+    save_build_manifest(manifest, changed)
+    build_metrics.record("build", "changed", changed)
+    report_build_changes(changed, github_output)
+    return all(result is not None for result in results)
+
+def generate_pac(proxy=PROXY_SERVER, direct=DIRECT_RULE, default=DEFAULT_RULE, skip_download=False, check_duplicates=False, source="metacubex", output_name="proxy.pac", minimize=True, encoding="flat", cache_dir=CACHE_DIR, force=False, decision_cache=DECISION_CACHE_SIZE, minify=False, compress=False, host_profile=None, hot_hosts=HOT_HOSTS_SIZE, formats=None, allow_missing=False):
+    """生成 PAC 文件（以及 formats 中的其他格式），区分后缀匹配和全字匹配域名"""
+    target = make_target(source, output_name, proxy, direct, default)
+    options = {
+        "encoding": encoding,
+        "decision_cache": decision_cache,
+        "minify": minify,
+        "compress": compress,
+        "host_profile": host_profile,
+        "hot_hosts": hot_hosts,
+        "formats": formats or ["pac"]
+    }
+    return generate_pac_targets([target], skip_download, check_duplicates, minimize, cache_dir, force, options, allow_missing)
+
+RULE_LABELS = {"suffixes": "后缀匹配", "domains": "全字匹配", "cidrs": "IP 段", "keywords": "关键字", "regexes": "正则"}
+DIFF_PREVIEW = 20  # 比较结果中每类变化在控制台最多显示的条数，完整结果见 --diff-report
+DIFF_STAGE_LABELS = {"load_old": "读取旧规则", "build_new": "构建新规则", "diff_rules": "比较规则", "replay": "重新判定"}
+
+def diff_against(old_file, skip_download=False, check_duplicates=False, source="metacubex", minimize=True, cache_dir=CACHE_DIR, hosts_file=None, report_file=None, allow_missing=False):
+    """
+    将本次构建的规则集与以前生成的 PAC 文件或二进制规则文件比较，不写入任何输出文件：
+    输出各类规则的增删，并用新旧两份规则集重新判定 host（hosts_file 中的访问记录，
+    未指定时为有变化的域名规则本身），返回判定结果变化的 [(host, 旧结果, 新结果, 访问次数)]，失败时返回 None
+    """
+    # pac_engine 依赖本模块，在函数内导入以避免循环导入
+    import pac_engine
+    seconds = {}
+    start = time.perf_counter()
+    try:
+        old_rule_sets = read_rule_snapshot(old_file)
+    except (OSError, ValueError, zlib.error) as e:
+        print(f"读取旧规则失败: {e}")
+        return None
+    seconds["load_old"] = time.perf_counter() - start
+    print(f"旧规则 ({old_file}): 直连 {describe_rules(old_rule_sets['direct'])}; 代理 {describe_rules(old_rule_sets['proxy'])}")
+
+    start = time.perf_counter()
+    new_rule_sets = build_rule_sets(skip_download, check_duplicates, source, minimize, cache_dir, allow_missing)
+    if new_rule_sets is None:
+        return None
+    seconds["build_new"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    diff = diff_rule_sets(old_rule_sets, new_rule_sets)
+    seconds["diff_rules"] = time.perf_counter() - start
+    print("\n规则变化:")
+    for kind, kind_label in (("direct", "直连"), ("proxy", "代理")):
+        for key in RULE_KEYS:
+            added, removed = diff[kind][key]["added"], diff[kind][key]["removed"]
+            if not added and not removed:
+                continue
+            print(f"{kind_label} {RULE_LABELS[key]}: 新增 {len(added)} 条, 移除 {len(removed)} 条")
+            for sign, items in (("+", added), ("-", removed)):
+                for item in items[:DIFF_PREVIEW]:
+                    print(f"  {sign} {item}")
+                if len(items) > DIFF_PREVIEW:
+                    print(f"  {sign} ... 另有 {len(items) - DIFF_PREVIEW} 条")
+    if not any(items for rules in diff.values() for change in rules.values() for items in change.values()):
+        print("没有变化")
+
+    if hosts_file:
+        try:
+            host_counts = read_host_profile(hosts_file)
+        except OSError as e:
+            print(f"读取 host 列表失败: {e}")
+            return None
+    else:
+        host_counts = {}
+        for kind in ("direct", "proxy"):
+            for key in DOMAIN_KEYS:
+                for domain in diff[kind][key]["added"] + diff[kind][key]["removed"]:
+                    host_counts[domain] = 1
+
+    start = time.perf_counter()
+    hosts = list(host_counts)
+    changes = [
+        (host, old, new, host_counts[host])
+        for host, old, new in pac_engine.diff_decisions(
+            hosts, pac_engine.compile_rules(old_rule_sets), pac_engine.compile_rules(new_rule_sets)
+        )
+    ]
+    seconds["replay"] = time.perf_counter() - start
+    changes.sort(key=lambda change: -change[3])
+
+    corpus = f"{hosts_file} 中的 host" if hosts_file else "有变化的域名规则"
+    transitions = {}
+    for _, old, new, count in changes:
+        hosts_changed, requests_changed = transitions.get((old, new), (0, 0))
+        transitions[(old, new)] = (hosts_changed + 1, requests_changed + count)
+    print(f"\n重新判定 {corpus}: {len(hosts)} 个, 判定结果变化 {len(changes)} 个")
+    for (old, new), (hosts_changed, requests_changed) in sorted(transitions.items()):
+        print(f"{old} -> {new}: {hosts_changed} 个 host" + (f", {requests_changed} 次访问" if hosts_file else ""))
+    for host, old, new, count in changes[:DIFF_PREVIEW]:
+        print(f"  {host}: {old} -> {new}" + (f" ({count} 次)" if hosts_file else ""))
+    if len(changes) > DIFF_PREVIEW:
+        print(f"  ... 另有 {len(changes) - DIFF_PREVIEW} 个")
+    print("比较耗时: " + ", ".join(f"{DIFF_STAGE_LABELS[name]} {value:.2f} 秒" for name, value in seconds.items()))
+
+    if report_file:
+        report = {
+            "old": old_file,
+            "source": source,
+            "rules": diff,
+            "hosts": {
+                "corpus": hosts_file,
+                "total": len(hosts),
+                "changed": [{"host": host, "old": old, "new": new, "count": count} for host, old, new, count in changes]
+            },
+            "seconds": {name: round(value, 6) for name, value in seconds.items()}
+        }
+        with open(report_file, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"比较结果已写入: {report_file}")
+    return changes
 
 def show_help():
     """显示帮助信息"""
@@ -267,13 +1693,45 @@ def show_help():
     print(f"                     默认值: {DIRECT_RULE}")
     print("  --default DEFAULT  设置默认规则，用于不匹配任何规则的情况")
     print(f"                     默认值: 与 --proxy 相同")
-    print("  --skip-download    跳过下载 ACL4SSR 中国域名列表")
+    print("  --skip-download    跳过下载 ACL4SSR 中国域名列表，使用缓存快照；没有快照时构建失败")
+    print("  --allow-missing-sources 与 --skip-download 一起使用：没有缓存快照的列表按空列表处理，")
+    print("                     只用于本地调试，生成的 PAC 文件不含这些列表中的域名")
     print("  --check-duplicates 检查 direct.txt 中与 ACL4SSR 中国域名列表重复的域名，并在生成 PAC 文件时排除这些重复域名")
+    print("  --no-minimize      不精简规则（默认会移除被上级后缀或代理规则覆盖的冗余规则）")
+    print("  --encoding MODE    PAC 中域名表的编码方式: flat（以域名为键的对象）或 trie（紧凑字典树字符串）")
+    print("                     默认值: flat")
+    print("  --cache-dir DIR    上游域名列表的缓存目录，下载失败时回退到缓存快照")
+    print(f"                     默认值: {CACHE_DIR}")
+    print("  --no-cache         不读写缓存")
+    print("  --targets FILE     从 JSON 文件读取多个构建目标（source/output/proxy/direct/default），")
+    print("                     一次运行生成多个 PAC 文件，共享的输入只下载和解析一次")
+    print("  --decision-cache N PAC 中按 host 缓存判定结果的最大条数，超出后淘汰最早的条目，0 表示不缓存")
+    print(f"                     默认值: {DECISION_CACHE_SIZE}")
+    print("  --minify           精简 PAC 文件：去掉模板中的注释、缩进和空行，域名表使用紧凑 JSON")
+    print("  --compress         在每个 PAC 文件旁生成最高压缩等级的 .gz 文件，以及 .br（需安装 brotli）")
+    print("                     或 .zst（需安装 zstandard）文件")
+    print(f"  --formats LIST     逗号分隔的输出格式: {', '.join(OUTPUT_FORMATS)}，默认值: pac")
+    print("                     一次构建中合并好的规则集并行导出为各格式，不会重复下载和解析")
+    print("  --host-profile FILE 访问日志或 host 访问次数文件（每行 \"host 次数\"），访问最多的 host 的判定结果")
+    print("                     会预先写入 PAC 并最先检查，同时输出按访问分布估算的平均查表次数")
+    print(f"  --hot-hosts N      热点 host 表的大小，默认值: {HOT_HOSTS_SIZE}")
+    print("  --metrics FILE     将各阶段（下载、解析、去重、合并、格式化、写入）的耗时和内存、")
+    print("                     各来源的条目数和输出文件大小写入 JSON 文件")
+    print("  --profile FILE     对整次运行做 cProfile，结果写入 FILE（可用 python3 -m pstats FILE 查看）")
+    print("  --force            忽略构建清单，即使输入未变化也重新生成所有 PAC 文件")
+    print("  --diff-against OLD 不生成文件，将本次构建的规则与以前生成的 PAC 文件或二进制规则文件（.rules.bin）比较，")
+    print("                     输出各类规则的增删以及判定结果变化的 host，有 host 的判定结果变化时以状态码 1 退出")
+    print("  --diff-hosts FILE  比较时重新判定的 host（访问日志或 \"host 次数\" 文件），默认为有变化的域名规则本身")
+    print("  --diff-report FILE 将完整的比较结果写入 JSON 文件")
     print("  --help             显示此帮助信息\n")
     print("示例:")
     print("  python3 generate_pac.py --proxy \"PROXY 192.168.1.100:8080; DIRECT\"")
     print("  python3 generate_pac.py --direct \"DIRECT\" --default \"SOCKS5 127.0.0.1:1080; DIRECT\"")
     print("  python3 generate_pac.py --check-duplicates")
+    print("  python3 generate_pac.py --targets targets.json")
+    print("  python3 generate_pac.py --minify --compress")
+    print("  python3 generate_pac.py --formats pac,clash,dnsmasq,singbox,binary")
+    print("  python3 generate_pac.py --diff-against output/proxy.pac --diff-hosts access.log")
 
 if __name__ == "__main__":
     # 支持命令行参数设置代理服务器和默认规则
@@ -284,6 +1742,23 @@ if __name__ == "__main__":
     check_duplicates = False
     source = "metacubex"
     output_name = "proxy.pac"
+    minimize = True
+    encoding = "flat"
+    cache_dir = CACHE_DIR
+    targets_file = None
+    force = False
+    decision_cache = DECISION_CACHE_SIZE
+    minify = False
+    compress = False
+    metrics_file = None
+    profile_file = None
+    host_profile = None
+    hot_hosts = HOT_HOSTS_SIZE
+    formats = ["pac"]
+    allow_missing = False
+    diff_old = None
+    diff_hosts = None
+    diff_report = None
 
     # 解析命令行参数
     i = 1
@@ -300,35 +1775,145 @@ if __name__ == "__main__":
         elif sys.argv[i] == "--skip-download":
             skip_download = True
             i += 1
+        elif sys.argv[i] == "--allow-missing-sources":
+            allow_missing = True
+            i += 1
         elif sys.argv[i] == "--check-duplicates":
             check_duplicates = True
             i += 1
+        elif sys.argv[i] == "--no-minimize":
+            minimize = False
+            i += 1
         elif sys.argv[i] == "--source" and i+1 < len(sys.argv):
             source = sys.argv[i+1]
             if source not in ("acl4ssr", "metacubex"):
                 print(f"错误: --source 必须为 acl4ssr 或 metacubex")
                 sys.exit(1)
             i += 2
+        elif sys.argv[i] == "--encoding" and i+1 < len(sys.argv):
+            encoding = sys.argv[i+1]
+            if encoding not in PAC_ENCODINGS:
+                print(f"错误: --encoding 必须为 flat 或 trie")
+                sys.exit(1)
+            i += 2
+        elif sys.argv[i] == "--cache-dir" and i+1 < len(sys.argv):
+            cache_dir = sys.argv[i+1]
+            i += 2
+        elif sys.argv[i] == "--no-cache":
+            cache_dir = None
+            i += 1
         elif sys.argv[i] == "--output" and i+1 < len(sys.argv):
             output_name = sys.argv[i+1]
             i += 2
+        elif sys.argv[i] == "--decision-cache" and i+1 < len(sys.argv):
+            try:
+                decision_cache = int(sys.argv[i+1])
+            except ValueError:
+                decision_cache = -1
+            if decision_cache < 0:
+                print(f"错误: --decision-cache 必须为非负整数")
+                sys.exit(1)
+            i += 2
+        elif sys.argv[i] == "--minify":
+            minify = True
+            i += 1
+        elif sys.argv[i] == "--compress":
+            compress = True
+            i += 1
+        elif sys.argv[i] == "--formats" and i+1 < len(sys.argv):
+            formats = list(dict.fromkeys(name.strip() for name in sys.argv[i+1].split(",") if name.strip()))
+            unknown = [name for name in formats if name not in OUTPUT_FORMATS]
+            if unknown or not formats:
+                print(f"错误: --formats 必须为 {', '.join(OUTPUT_FORMATS)} 中的一个或多个")
+                sys.exit(1)
+            i += 2
+        elif sys.argv[i] == "--host-profile" and i+1 < len(sys.argv):
+            host_profile = sys.argv[i+1]
+            i += 2
+        elif sys.argv[i] == "--hot-hosts" and i+1 < len(sys.argv):
+            try:
+                hot_hosts = int(sys.argv[i+1])
+            except ValueError:
+                hot_hosts = -1
+            if hot_hosts < 0:
+                print(f"错误: --hot-hosts 必须为非负整数")
+                sys.exit(1)
+            i += 2
+        elif sys.argv[i] == "--metrics" and i+1 < len(sys.argv):
+            metrics_file = sys.argv[i+1]
+            i += 2
+        elif sys.argv[i] == "--profile" and i+1 < len(sys.argv):
+            profile_file = sys.argv[i+1]
+            i += 2
+        elif sys.argv[i] == "--force":
+            force = True
+            i += 1
+        elif sys.argv[i] == "--targets" and i+1 < len(sys.argv):
+            targets_file = sys.argv[i+1]
+            i += 2
+        elif sys.argv[i] == "--diff-against" and i+1 < len(sys.argv):
+            diff_old = sys.argv[i+1]
+            i += 2
+        elif sys.argv[i] == "--diff-hosts" and i+1 < len(sys.argv):
+            diff_hosts = sys.argv[i+1]
+            i += 2
+        elif sys.argv[i] == "--diff-report" and i+1 < len(sys.argv):
+            diff_report = sys.argv[i+1]
+            i += 2
         elif sys.argv[i] == "--help":
             show_help()
             sys.exit(0)
         else:
             i += 1
 
-    print(f"使用代理服务器: {proxy}")
-    print(f"使用直连规则: {direct}")
-    print(f"使用默认规则: {default}")
-    print(f"域名列表来源: {source}")
+    if allow_missing and not skip_download:
+        print("错误: --allow-missing-sources 只能与 --skip-download 一起使用")
+        sys.exit(1)
+
+    if diff_old:
+        print(f"与旧规则比较: {diff_old} (来源: {source})")
+        changes = build_metrics.run(
+            lambda: diff_against(diff_old, skip_download, check_duplicates, source, minimize, cache_dir, diff_hosts, diff_report, allow_missing),
+            "generate_pac", metrics_file, profile_file
+        )
+        sys.exit(1 if changes is None or changes else 0)
+
+    if targets_file:
+        try:
+            targets = read_targets_file(targets_file, proxy, direct, default)
+        except (OSError, ValueError) as e:
+            print(f"读取构建目标失败: {e}")
+            sys.exit(1)
+        for target in targets:
+            print(f"构建目标: {target['output']} (来源: {target['source']})")
+    else:
+        targets = [make_target(source, output_name, proxy, direct, default)]
+        print(f"使用代理服务器: {proxy}")
+        print(f"使用直连规则: {direct}")
+        print(f"使用默认规则: {default}")
+        print(f"域名列表来源: {source}")
     if skip_download:
         print("跳过下载中国域名列表")
     if check_duplicates:
         print("将检查直连域名列表中的重复项")
 
     # 生成 PAC 文件
-    if generate_pac(proxy, direct, default, skip_download, check_duplicates, source, output_name):
+    if compress and brotli is None and zstandard is None:
+        print("未安装 brotli 或 zstandard，仅生成 .gz 压缩文件")
+    options = {
+        "encoding": encoding,
+        "decision_cache": decision_cache,
+        "minify": minify,
+        "compress": compress,
+        "host_profile": host_profile,
+        "hot_hosts": hot_hosts,
+        "formats": formats
+    }
+    if build_metrics.run(
+        lambda: generate_pac_targets(targets, skip_download, check_duplicates, minimize, cache_dir, force, options, allow_missing,
+                                     os.environ.get("GITHUB_OUTPUT")),
+        "generate_pac", metrics_file, profile_file
+    ):
         print("PAC 文件生成成功！")
     else:
         print("PAC 文件生成失败！")
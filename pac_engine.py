@@ -0,0 +1,339 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+PAC 判定引擎：使用 generate_pac.py 构建的同一份规则集，在 Python 中复现
+pac-template 中 FindProxyForURL 的判定顺序（内网 IP -> 代理规则 -> 直连规则 -> 默认规则），
+并支持借助进程池批量判定大量 host（例如一天的代理访问日志）
+
+使用方法:
+    python3 pac_engine.py hosts.txt [--source metacubex|acl4ssr] [--workers N] [--output result.tsv]
+"""
+
+import os
+import re
+import bisect
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from urllib.parse import urlsplit
+
+import generate_pac
+
+DECISION_DIRECT = "direct"
+DECISION_PROXY = "proxy"
+DECISION_DEFAULT = "default"
+CHUNK_SIZE = 5000  # 每个进程任务处理的 host 数量
+
+# 与 pac-template 中的 privateIpRanges 保持一致
+PRIVATE_IP_RANGES = generate_pac.merge_ip_ranges(
+    ["10.0.0.0/8", "127.0.0.0/8", "169.254.0.0/16", "172.16.0.0/12", "192.168.0.0/16"]
+)
+# 与 pac-template 中 isPrivateIp 使用的 IPv6 正则保持一致
+PRIVATE_IPV6_PATTERNS = [
+    re.compile(r"^f[cd][0-9a-f]{2}:"),
+    re.compile(r"^fe80:"),
+]
+
+def ipv4_to_int(host):
+    """将点分十进制 IPv4 地址转换为整数，不是 IPv4 地址时返回 -1，对应 PAC 中的 ipv4ToInt"""
+    if not host or not host[-1].isdigit():
+        return -1
+    parts = host.split(".")
+    if len(parts) != 4:
+        return -1
+    value = 0
+    for part in parts:
+        if not part or len(part) > 3 or not part.isascii() or not part.isdigit() or int(part) > 255:
+            return -1
+        value = value * 256 + int(part)
+    return value
+
+def host_ip(host):
+    """取出 host 对应的 IPv4 整数（支持 ::ffff: 映射形式），与 FindProxyForURL 中的处理一致"""
+    return ipv4_to_int(host[7:] if host.startswith("::ffff:") else host)
+
+def ip_in_ranges(ip, ranges):
+    """在排序且互不重叠的区间 (starts, ends) 中二分查找 ip，对应 PAC 中的 ipInRanges"""
+    if ip < 0:
+        return False
+    starts, ends = ranges
+    index = bisect.bisect_right(starts, ip) - 1
+    return index >= 0 and ip <= ends[index]
+
+def is_private_ip(host, ip=None):
+    """判断已转为小写的 host 是否为内网 IP，对应 PAC 中的 isPrivateIp"""
+    if ip is None:
+        ip = host_ip(host)
+    if ip >= 0:
+        return ip_in_ranges(ip, PRIVATE_IP_RANGES)
+    if ":" not in host:
+        return False
+    return any(pattern.search(host) for pattern in PRIVATE_IPV6_PATTERNS) or host in ("::1", "::")
+
+def domain_suffix_match(host, suffixes):
+    """从右向左逐级取出 host 的后缀并查表，对应 PAC 中的 domainSuffixMatch"""
+    pos = len(host)
+    while pos > 0:
+        pos = host.rfind(".", 0, pos)
+        if host[pos + 1:] in suffixes:
+            return True
+    return False
+
+def suffix_probes(host, suffixes):
+    """返回 domain_suffix_match 的查表次数和是否命中，用于估算查找开销"""
+    probes = 0
+    pos = len(host)
+    while pos > 0:
+        pos = host.rfind(".", 0, pos)
+        probes += 1
+        if host[pos + 1:] in suffixes:
+            return probes, True
+    return probes, False
+
+def count_probes(host, rules):
+    """
+    估算 PAC 判定单个 host 的查表次数（哈希查找、关键字自动机扫描、合并正则匹配或 IP 段二分查找各计 1 次），
+    顺序与 classify_host 一致，命中即停止
+    """
+    host = host.lower()
+    ip = host_ip(host)
+    probes = 0
+    if ip >= 0:
+        probes += 1
+        if ip_in_ranges(ip, PRIVATE_IP_RANGES):
+            return probes
+    for kind in ("proxy", "direct"):
+        domain_rules = rules[kind]
+        suffix_count, matched = suffix_probes(host, domain_rules["suffixes"])
+        probes += suffix_count + (0 if matched else 1)
+        if matched or host in domain_rules["domains"]:
+            return probes
+        if domain_rules["keywords"]:
+            probes += 1
+            if generate_pac.keyword_match(host, domain_rules["keywords"]):
+                return probes
+        if domain_rules["regex"]:
+            probes += 1
+            if domain_rules["regex"].search(host):
+                return probes
+        if ip >= 0:
+            probes += 1
+            if ip_in_ranges(ip, domain_rules["ip_ranges"]):
+                return probes
+    return probes
+
+def combine_regexes(regexes):
+    """将正则集合合并为一个正则，对应 PAC 中的 combineRegexRules，没有正则时返回 None"""
+    if not regexes:
+        return None
+    return re.compile("|".join(f"(?:{regex})" for regex in sorted(regexes)))
+
+def compile_rules(rule_sets):
+    """将 build_rule_sets 返回的规则集转换为判定使用的不可变结构，关键字编译为与 PAC 相同的自动机"""
+    return {
+        kind: {
+            "suffixes": frozenset(rule_sets[kind].get("suffixes", set())),
+            "domains": frozenset(rule_sets[kind].get("domains", set())),
+            "keywords": generate_pac.build_keyword_automaton(rule_sets[kind]["keywords"]) if rule_sets[kind].get("keywords") else None,
+            "regex": combine_regexes(rule_sets[kind].get("regexes", set())),
+            "ip_ranges": generate_pac.merge_ip_ranges(rule_sets[kind].get("cidrs", set()))
+        }
+        for kind in ("direct", "proxy")
+    }
+
+def match_domain_rules(host, ip, domain_rules):
+    """判断已转为小写的 host 是否命中后缀、全字匹配、关键字、正则或 IP 段规则"""
+    return (domain_suffix_match(host, domain_rules["suffixes"])
+            or host in domain_rules["domains"]
+            or (domain_rules["keywords"] is not None and generate_pac.keyword_match(host, domain_rules["keywords"]))
+            or (domain_rules["regex"] is not None and domain_rules["regex"].search(host) is not None)
+            or ip_in_ranges(ip, domain_rules["ip_ranges"]))
+
+def classify_host(host, rules):
+    """判定单个 host 的结果（direct / proxy / default），与 FindProxyForURL 的顺序一致"""
+    host = host.lower()
+    ip = host_ip(host)
+    if is_private_ip(host, ip):
+        return DECISION_DIRECT
+    if match_domain_rules(host, ip, rules["proxy"]):
+        return DECISION_PROXY
+    if match_domain_rules(host, ip, rules["direct"]):
+        return DECISION_DIRECT
+    return DECISION_DEFAULT
+
+_worker_rules = None
+
+def _init_worker(rules):
+    """进程池初始化：每个工作进程只接收一次规则集"""
+    global _worker_rules
+    _worker_rules = rules
+
+def _classify_chunk(hosts):
+    return [classify_host(host, _worker_rules) for host in hosts]
+
+def classify_hosts(hosts, rules, workers=None, chunk_size=CHUNK_SIZE):
+    """
+    批量判定 host 列表，返回与输入顺序一致的判定结果列表
+
+    Args:
+        hosts: host 列表
+        rules: compile_rules 返回的规则集
+        workers: 进程数，默认为 CPU 核数；为 1 时在当前进程中判定
+        chunk_size: 每个进程任务处理的 host 数量
+    """
+    workers = workers or os.cpu_count() or 1
+    if workers <= 1 or len(hosts) <= chunk_size:
+        return [classify_host(host, rules) for host in hosts]
+
+    chunks = [hosts[i:i + chunk_size] for i in range(0, len(hosts), chunk_size)]
+    decisions = []
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(rules,)) as executor:
+        for result in executor.map(_classify_chunk, chunks):
+            decisions.extend(result)
+    return decisions
+
+def changed_decisions(hosts, old_rules, new_rules):
+    """用两份规则集分别判定 hosts，返回结果不同的 (host, 旧结果, 新结果) 列表"""
+    changes = []
+    for host in hosts:
+        old = classify_host(host, old_rules)
+        new = classify_host(host, new_rules)
+        if old != new:
+            changes.append((host, old, new))
+    return changes
+
+_worker_rule_pair = None
+
+def _init_diff_worker(old_rules, new_rules):
+    """进程池初始化：每个工作进程只接收一次新旧两份规则集"""
+    global _worker_rule_pair
+    _worker_rule_pair = (old_rules, new_rules)
+
+def _diff_chunk(hosts):
+    return changed_decisions(hosts, *_worker_rule_pair)
+
+def diff_decisions(hosts, old_rules, new_rules, workers=None, chunk_size=CHUNK_SIZE):
+    """
+    批量比较两份规则集对 hosts 的判定结果，返回结果不同的 (host, 旧结果, 新结果) 列表，顺序与输入一致；
+    每个进程任务用两份规则集判定同一批 host，参数含义与 classify_hosts 相同
+    """
+    workers = workers or os.cpu_count() or 1
+    if workers <= 1 or len(hosts) <= chunk_size:
+        return changed_decisions(hosts, old_rules, new_rules)
+
+    chunks = [hosts[i:i + chunk_size] for i in range(0, len(hosts), chunk_size)]
+    changes = []
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_diff_worker, initargs=(old_rules, new_rules)) as executor:
+        for result in executor.map(_diff_chunk, chunks):
+            changes.extend(result)
+    return changes
+
+def extract_host(line):
+    """
+    从一行文本中提取 host，支持纯 host、URL 以及包含 URL 字段的访问日志行，
+    无法提取时返回 None
+    """
+    fields = line.split()
+    if not fields or fields[0].startswith("#"):
+        return None
+    field = next((f for f in fields if "://" in f), fields[0])
+    if "://" in field:
+        try:
+            return urlsplit(field).hostname
+        except ValueError:
+            return None
+    # host:port 形式（如 CONNECT 日志），IPv6 地址不处理端口
+    if field.count(":") == 1:
+        field = field.split(":")[0]
+    return field.strip("[]") or None
+
+def read_host_file(filename):
+    """读取 host 列表文件，每行一个 host、URL 或访问日志记录"""
+    hosts = []
+    with open(filename, "r", encoding="utf-8", errors="replace") as f:
+        for line in f:
+            host = extract_host(line)
+            if host:
+                hosts.append(host)
+    return hosts
+
+def show_help():
+    """显示帮助信息"""
+    print("PAC 判定引擎 - 使用与 PAC 相同的规则集批量判定 host")
+    print("\n用法: python3 pac_engine.py HOSTS_FILE [选项]")
+    print("\n选项:")
+    print("  --source SOURCE    中国域名列表来源: acl4ssr 或 metacubex，默认值: metacubex")
+    print("  --skip-download    跳过下载域名列表，有缓存快照时使用快照，没有时仅使用 config 中的自定义规则")
+    print("  --workers N        判定使用的进程数，默认值: CPU 核数")
+    print("  --output FILE      将每个 host 的判定结果写入文件（制表符分隔）")
+    print("  --help             显示此帮助信息")
+
+if __name__ == "__main__":
+    hosts_file = None
+    source = "metacubex"
+    skip_download = False
+    workers = None
+    output_file = None
+
+    # 解析命令行参数
+    i = 1
+    while i < len(sys.argv):
+        if sys.argv[i] == "--source" and i+1 < len(sys.argv):
+            source = sys.argv[i+1]
+            if source not in ("acl4ssr", "metacubex"):
+                print(f"错误: --source 必须为 acl4ssr 或 metacubex")
+                sys.exit(1)
+            i += 2
+        elif sys.argv[i] == "--skip-download":
+            skip_download = True
+            i += 1
+        elif sys.argv[i] == "--workers" and i+1 < len(sys.argv):
+            try:
+                workers = int(sys.argv[i+1])
+            except ValueError:
+                workers = 0
+            if workers < 1:
+                print(f"错误: --workers 必须为正整数")
+                sys.exit(1)
+            i += 2
+        elif sys.argv[i] == "--output" and i+1 < len(sys.argv):
+            output_file = sys.argv[i+1]
+            i += 2
+        elif sys.argv[i] == "--help":
+            show_help()
+            sys.exit(0)
+        elif not sys.argv[i].startswith("--") and hosts_file is None:
+            hosts_file = sys.argv[i]
+            i += 1
+        else:
+            i += 1
+
+    if not hosts_file:
+        show_help()
+        sys.exit(1)
+
+    # 本地分析工具：--skip-download 时允许没有缓存快照的列表按空列表处理
+    rule_sets = generate_pac.build_rule_sets(skip_download, source=source, allow_missing=skip_download)
+    if rule_sets is None:
+        sys.exit(1)
+    rules = compile_rules(rule_sets)
+    hosts = read_host_file(hosts_file)
+    print(f"读取 host 数量: {len(hosts)}")
+
+    start = time.perf_counter()
+    decisions = classify_hosts(hosts, rules, workers)
+    elapsed = time.perf_counter() - start
+
+    counts = {}
+    for decision in decisions:
+        counts[decision] = counts.get(decision, 0) + 1
+    for decision in (DECISION_PROXY, DECISION_DIRECT, DECISION_DEFAULT):
+        print(f"{decision}: {counts.get(decision, 0)}")
+    print(f"判定耗时: {elapsed:.3f} 秒, 吞吐量: {len(hosts) / max(elapsed, 1e-9):.0f} host/秒")
+
+    if output_file:
+        with open(output_file, "w", encoding="utf-8") as f:
+            for host, decision in zip(hosts, decisions):
+                f.write(f"{host}\t{decision}\n")
+        print(f"判定结果已写入: {output_file}")
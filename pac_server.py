@@ -0,0 +1,459 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+本地 PAC 服务器：基于 asyncio 提供 OUTPUT_DIR 中的文件，
+支持强 ETag / 304、按 Accept-Encoding 选择 gzip 或 brotli、HTTP/1.1 长连接，
+并在 config/direct.txt、config/proxy.txt 或 pac-template 变化时后台重新生成 PAC，
+生成完成后整体替换内存中的文件内容。/metrics 返回请求数和延迟统计（JSON）。
+
+使用方法:
+    python3 pac_server.py [--host 0.0.0.0] [--port 8080] [--targets targets.json] [--interval 2]
+"""
+
+import asyncio
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import sys
+import time
+from datetime import datetime
+from email.utils import formatdate
+
+import generate_pac
+
+HOST = "0.0.0.0"
+PORT = 8080
+WATCH_INTERVAL = 2.0  # 检查配置文件变化的间隔（秒）
+KEEP_ALIVE_TIMEOUT = 15  # 长连接空闲超时（秒）
+MAX_HEADER_BYTES = 16 * 1024  # 请求头的最大长度
+BACKLOG = 4096  # 监听队列长度，应对大量客户端同时连接
+WATCH_FILES = [
+    os.path.join(generate_pac.CONFIG_DIR, "direct.txt"),
+    os.path.join(generate_pac.CONFIG_DIR, "proxy.txt"),
+    generate_pac.PAC_TEMPLATE
+]
+PAC_CONTENT_TYPE = "application/x-ns-proxy-autoconfig"
+LATENCY_BUCKETS_MS = (0.5, 1, 2, 5, 10, 25, 50, 100, 250, 1000)
+STATUS_TEXT = {
+    200: "OK",
+    304: "Not Modified",
+    400: "Bad Request",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    431: "Request Header Fields Too Large"
+}
+
+# 服务器状态：files 在重新加载时整体替换，请求处理中不会看到写到一半的内容
+state = {
+    "files": {},
+    "loaded_at": None,
+    "rebuilding": False
+}
+metrics = {
+    "started_at": datetime.now().isoformat(timespec="seconds"),
+    "connections_total": 0,
+    "connections_active": 0,
+    "requests_total": 0,
+    "responses": {},
+    "encodings": {},
+    "bytes_sent": 0,
+    "latency_ms": {"count": 0, "sum": 0.0, "max": 0.0, "buckets": {str(b): 0 for b in LATENCY_BUCKETS_MS}},
+    "reloads": 0,
+    "rebuilds": 0,
+    "rebuild_failures": 0,
+    "last_rebuild_seconds": None
+}
+
+def compress_gzip(data):
+    return gzip.compress(data, compresslevel=9, mtime=0)
+
+def compress_brotli(data):
+    return generate_pac.brotli.compress(data, quality=11, mode=generate_pac.brotli.MODE_TEXT)
+
+def read_precompressed(path, ext):
+    """读取 generate_pac.py --compress 生成的预压缩文件，不存在或早于原文件时返回 None"""
+    compressed_path = path + ext
+    try:
+        if os.path.getmtime(compressed_path) < os.path.getmtime(path):
+            return None
+        with open(compressed_path, "rb") as f:
+            return f.read()
+    except OSError:
+        return None
+
+def load_file_entry(path):
+    """
+    读取单个文件并准备各编码的响应内容，返回
+    {"content_type", "last_modified", "variants": {编码: (内容, ETag)}}
+    """
+    with open(path, "rb") as f:
+        data = f.read()
+    digest = hashlib.sha256(data).hexdigest()[:32]
+    variants = {"identity": (data, f'"{digest}"')}
+    gz = read_precompressed(path, ".gz") or compress_gzip(data)
+    variants["gzip"] = (gz, f'"{digest}-gzip"')
+    if generate_pac.brotli is not None or os.path.exists(path + ".br"):
+        br = read_precompressed(path, ".br")
+        if br is None and generate_pac.brotli is not None:
+            br = compress_brotli(data)
+        if br is not None:
+            variants["br"] = (br, f'"{digest}-br"')
+    if path.endswith(".pac"):
+        content_type = PAC_CONTENT_TYPE
+    else:
+        content_type = mimetypes.guess_type(path)[0] or "application/octet-stream"
+    return {
+        "content_type": content_type,
+        "last_modified": formatdate(os.path.getmtime(path), usegmt=True),
+        "variants": variants
+    }
+
+def output_signature(output_dir=generate_pac.OUTPUT_DIR):
+    """返回输出目录中可提供文件的 (文件名, 修改时间, 大小) 列表，用于判断是否需要重新加载"""
+    signature = []
+    try:
+        names = sorted(os.listdir(output_dir))
+    except OSError:
+        return signature
+    for name in names:
+        path = os.path.join(output_dir, name)
+        if name.startswith(".") or name.endswith((".gz", ".br", ".zst")) or not os.path.isfile(path):
+            continue
+        stat = os.stat(path)
+        signature.append((name, stat.st_mtime_ns, stat.st_size))
+    return signature
+
+def load_output_files(output_dir=generate_pac.OUTPUT_DIR):
+    """读取输出目录中的所有文件（隐藏文件和压缩文件除外），返回 {URL 路径: 文件条目}"""
+    files = {}
+    for name, _, _ in output_signature(output_dir):
+        try:
+            files["/" + name] = load_file_entry(os.path.join(output_dir, name))
+        except OSError as e:
+            print(f"读取文件失败: {name}: {e}")
+    return files
+
+def reload_files():
+    """重新读取输出目录并整体替换 state["files"]"""
+    files = load_output_files()
+    state["files"] = files
+    state["loaded_at"] = datetime.now().isoformat(timespec="seconds")
+    metrics["reloads"] += 1
+    print(f"已加载 {len(files)} 个文件: {', '.join(sorted(files)) or '无'}")
+
+def parse_accept_encoding(header):
+    """解析 Accept-Encoding，返回 {编码: q 值}"""
+    accepted = {}
+    for item in header.split(","):
+        parts = item.strip().split(";")
+        name = parts[0].strip().lower()
+        if not name:
+            continue
+        q = 1.0
+        for param in parts[1:]:
+            key, _, value = param.strip().partition("=")
+            if key.strip() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        accepted[name] = q
+    return accepted
+
+def choose_encoding(entry, accept_encoding):
+    """按 Accept-Encoding 选择响应编码：客户端支持时优先 br，其次 gzip，否则不压缩"""
+    accepted = parse_accept_encoding(accept_encoding)
+    wildcard = accepted.get("*", 0.0)
+    for encoding in ("br", "gzip"):
+        if encoding in entry["variants"] and accepted.get(encoding, wildcard) > 0:
+            return encoding
+    return "identity"
+
+def etag_matches(if_none_match, etag):
+    """判断 If-None-Match 是否包含当前 ETag（支持 * 和多个值）"""
+    candidates = [value.strip() for value in if_none_match.split(",")]
+    return "*" in candidates or etag in candidates
+
+def record_latency(elapsed_ms):
+    latency = metrics["latency_ms"]
+    latency["count"] += 1
+    latency["sum"] += elapsed_ms
+    latency["max"] = max(latency["max"], elapsed_ms)
+    for bucket in LATENCY_BUCKETS_MS:
+        if elapsed_ms <= bucket:
+            latency["buckets"][str(bucket)] += 1
+            break
+
+def metrics_snapshot():
+    """返回 /metrics 的内容"""
+    latency = metrics["latency_ms"]
+    return dict(
+        metrics,
+        latency_ms=dict(latency, avg=latency["sum"] / latency["count"] if latency["count"] else 0.0),
+        files=sorted(state["files"]),
+        loaded_at=state["loaded_at"],
+        rebuilding=state["rebuilding"]
+    )
+
+def build_response(method, path, headers):
+    """根据请求生成 (状态码, 响应头列表, 响应体, 编码)"""
+    if method not in ("GET", "HEAD"):
+        return 405, [("Allow", "GET, HEAD")], b"", None
+    path = path.split("?", 1)[0]
+    if path == "/metrics":
+        body = json.dumps(metrics_snapshot(), ensure_ascii=False, indent=2).encode("utf-8")
+        return 200, [("Content-Type", "application/json; charset=utf-8"), ("Cache-Control", "no-store")], body, None
+    files = state["files"]
+    entry = files.get(path)
+    if entry is None and path == "/" and len(files) == 1:
+        entry = next(iter(files.values()))
+    if entry is None:
+        return 404, [("Content-Type", "text/plain; charset=utf-8")], b"not found\n", None
+
+    encoding = choose_encoding(entry, headers.get("accept-encoding", ""))
+    body, etag = entry["variants"][encoding]
+    response_headers = [
+        ("Content-Type", entry["content_type"]),
+        ("ETag", etag),
+        ("Last-Modified", entry["last_modified"]),
+        ("Vary", "Accept-Encoding"),
+        ("Cache-Control", "no-cache")
+    ]
+    if encoding != "identity":
+        response_headers.append(("Content-Encoding", encoding))
+    if_none_match = headers.get("if-none-match")
+    if if_none_match is not None:
+        if etag_matches(if_none_match, etag):
+            return 304, response_headers, b"", encoding
+    elif headers.get("if-modified-since") == entry["last_modified"]:
+        return 304, response_headers, b"", encoding
+    return 200, response_headers, body, encoding
+
+async def read_request(reader):
+    """读取一个请求头，返回 (方法, 路径, 版本, 请求头字典)；连接关闭时返回 None"""
+    try:
+        data = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), KEEP_ALIVE_TIMEOUT)
+    except (asyncio.IncompleteReadError, asyncio.TimeoutError, ConnectionError):
+        return None
+    except asyncio.LimitOverrunError:
+        return "too_large"
+    lines = data.decode("latin-1").split("\r\n")
+    parts = lines[0].split()
+    if len(parts) != 3:
+        return "bad"
+    headers = {}
+    for line in lines[1:]:
+        name, sep, value = line.partition(":")
+        if sep:
+            headers[name.strip().lower()] = value.strip()
+    return parts[0], parts[1], parts[2], headers
+
+async def handle_client(reader, writer):
+    """处理一个客户端连接，支持 HTTP/1.1 长连接"""
+    metrics["connections_total"] += 1
+    metrics["connections_active"] += 1
+    try:
+        while True:
+            request = await read_request(reader)
+            if request is None:
+                break
+            start = time.perf_counter()
+            keep_alive = False
+            if request == "too_large":
+                status, headers, body, encoding, method = 431, [], b"", None, "GET"
+            elif request == "bad":
+                status, headers, body, encoding, method = 400, [], b"", None, "GET"
+            else:
+                method, path, version, request_headers = request
+                connection = request_headers.get("connection", "").lower()
+                keep_alive = connection == "keep-alive" if version == "HTTP/1.0" else connection != "close"
+                status, headers, body, encoding = build_response(method, path, request_headers)
+                if status == 405:
+                    # 不读取 POST 等请求的正文，关闭连接，避免把正文当作下一个请求解析
+                    keep_alive = False
+
+            head = [f"HTTP/1.1 {status} {STATUS_TEXT[status]}"]
+            head.extend(f"{name}: {value}" for name, value in headers)
+            head.append(f"Date: {formatdate(usegmt=True)}")
+            head.append(f"Content-Length: {len(body)}")
+            head.append(f"Connection: {'keep-alive' if keep_alive else 'close'}")
+            payload = ("\r\n".join(head) + "\r\n\r\n").encode("latin-1")
+            if method != "HEAD":
+                payload += body
+            writer.write(payload)
+            await writer.drain()
+
+            metrics["requests_total"] += 1
+            metrics["responses"][str(status)] = metrics["responses"].get(str(status), 0) + 1
+            if status == 200 and encoding:
+                metrics["encodings"][encoding] = metrics["encodings"].get(encoding, 0) + 1
+            metrics["bytes_sent"] += len(payload)
+            record_latency((time.perf_counter() - start) * 1000)
+            if not keep_alive:
+                break
+    except ConnectionError:
+        pass
+    finally:
+        metrics["connections_active"] -= 1
+        writer.close()
+        try:
+            await writer.wait_closed()
+        except ConnectionError:
+            pass
+
+def watched_mtimes():
+    """返回需要监视的配置文件和模板的修改时间"""
+    mtimes = {}
+    for path in WATCH_FILES:
+        try:
+            mtimes[path] = os.stat(path).st_mtime_ns
+        except OSError:
+            mtimes[path] = None
+    return mtimes
+
+def rebuild(targets, options):
+    """在工作线程中重新生成 PAC；上游列表通过条件请求确认，未变化或网络不可用时使用缓存"""
+    start = time.perf_counter()
+    ok = generate_pac.generate_pac_targets(targets, options=options)
+    elapsed = time.perf_counter() - start
+    metrics["rebuilds"] += 1
+    metrics["last_rebuild_seconds"] = round(elapsed, 3)
+    if not ok:
+        metrics["rebuild_failures"] += 1
+    print(f"重新生成 PAC {'完成' if ok else '失败'}，耗时 {elapsed:.2f} 秒")
+    return ok
+
+async def watch_loop(targets, options, interval=WATCH_INTERVAL, auto_rebuild=True):
+    """
+    定期检查配置文件和模板，变化时在后台线程中重新生成 PAC；
+    同时检查输出目录，文件被重新生成（包括由其他进程生成）后重新加载
+    """
+    loop = asyncio.get_running_loop()
+    mtimes = watched_mtimes()
+    signature = output_signature()
+    while True:
+        await asyncio.sleep(interval)
+        current = watched_mtimes()
+        if auto_rebuild and current != mtimes:
+            changed = [path for path in current if current[path] != mtimes.get(path)]
+            print(f"检测到文件变化: {', '.join(changed)}，开始重新生成 PAC")
+            mtimes = current
+            state["rebuilding"] = True
+            try:
+                await loop.run_in_executor(None, rebuild, targets, options)
+            except Exception as e:
+                metrics["rebuild_failures"] += 1
+                print(f"重新生成 PAC 失败: {e}")
+            finally:
+                state["rebuilding"] = False
+        current_signature = output_signature()
+        if current_signature != signature:
+            signature = current_signature
+            # 读取和压缩在线程中完成，完成后一次性替换
+            await loop.run_in_executor(None, reload_files)
+
+async def serve(host, port, targets, options, interval, auto_rebuild):
+    reload_files()
+    server = await asyncio.start_server(
+        handle_client, host, port, backlog=BACKLOG, limit=MAX_HEADER_BYTES
+    )
+    addresses = ", ".join(str(sock.getsockname()) for sock in server.sockets)
+    print(f"PAC 服务器已启动: {addresses}")
+    watcher = asyncio.create_task(watch_loop(targets, options, interval, auto_rebuild))
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        watcher.cancel()
+
+def show_help():
+    """显示帮助信息"""
+    print("PAC 服务器 - 提供 output 目录中的 PAC 文件，并在配置变化时自动重新生成")
+    print("\n用法: python3 pac_server.py [选项]")
+    print("\n选项:")
+    print(f"  --host HOST        监听地址，默认值: {HOST}")
+    print(f"  --port PORT        监听端口，默认值: {PORT}")
+    print("  --targets FILE     重新生成时使用的构建目标文件（与 generate_pac.py --targets 相同）")
+    print("  --source SOURCE    未指定 --targets 时的中国域名列表来源: acl4ssr 或 metacubex，默认值: metacubex")
+    print("  --output FILE      未指定 --targets 时重新生成的 PAC 文件名，默认值: proxy.pac")
+    print("  --minify           重新生成时精简 PAC 文件")
+    print(f"  --interval SEC     检查配置文件变化的间隔（秒），默认值: {WATCH_INTERVAL}")
+    print("  --no-rebuild       只提供文件，不在配置变化时重新生成")
+    print("  --help             显示此帮助信息")
+
+if __name__ == "__main__":
+    host = HOST
+    port = PORT
+    targets_file = None
+    source = "metacubex"
+    output_name = "proxy.pac"
+    minify = False
+    interval = WATCH_INTERVAL
+    auto_rebuild = True
+
+    # 解析命令行参数
+    i = 1
+    while i < len(sys.argv):
+        if sys.argv[i] == "--host" and i+1 < len(sys.argv):
+            host = sys.argv[i+1]
+            i += 2
+        elif sys.argv[i] == "--port" and i+1 < len(sys.argv):
+            try:
+                port = int(sys.argv[i+1])
+            except ValueError:
+                port = 0
+            if not 1 <= port <= 65535:
+                print(f"错误: --port 必须为 1-65535 之间的整数")
+                sys.exit(1)
+            i += 2
+        elif sys.argv[i] == "--targets" and i+1 < len(sys.argv):
+            targets_file = sys.argv[i+1]
+            i += 2
+        elif sys.argv[i] == "--source" and i+1 < len(sys.argv):
+            source = sys.argv[i+1]
+            if source not in ("acl4ssr", "metacubex"):
+                print(f"错误: --source 必须为 acl4ssr 或 metacubex")
+                sys.exit(1)
+            i += 2
+        elif sys.argv[i] == "--output" and i+1 < len(sys.argv):
+            output_name = sys.argv[i+1]
+            i += 2
+        elif sys.argv[i] == "--minify":
+            minify = True
+            i += 1
+        elif sys.argv[i] == "--interval" and i+1 < len(sys.argv):
+            try:
+                interval = float(sys.argv[i+1])
+            except ValueError:
+                interval = 0.0
+            if not interval > 0:
+                print(f"错误: --interval 必须为正数")
+                sys.exit(1)
+            i += 2
+        elif sys.argv[i] == "--no-rebuild":
+            auto_rebuild = False
+            i += 1
+        elif sys.argv[i] == "--help":
+            show_help()
+            sys.exit(0)
+        else:
+            i += 1
+
+    if targets_file:
+        try:
+            targets = generate_pac.read_targets_file(targets_file)
+        except (OSError, ValueError) as e:
+            print(f"读取构建目标失败: {e}")
+            sys.exit(1)
+    else:
+        targets = [generate_pac.make_target(source, output_name)]
+    options = {"minify": minify, "compress": True}
+
+    generate_pac.ensure_dir(generate_pac.OUTPUT_DIR)
+    try:
+        asyncio.run(serve(host, port, targets, options, interval, auto_rebuild))
+    except KeyboardInterrupt:
+        print("PAC 服务器已停止")
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+校验 clean_direct_with_cnlist 只清理被来源覆盖的后缀和全字匹配规则，
+关键字、正则和 IP 段规则原样写回
+
+使用方法:
+    python3 -m unittest discover -s tests
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+import clean_direct_with_cnlist
+import generate_pac
+
+MIXED_DIRECT = """# 混合语法的 direct.txt
+.baidu.com
+www.baidu.com
+img.qq.com
+printer.local
+.onlymeta.com
+.example.org
+DOMAIN-KEYWORD,baidu
+DOMAIN-REGEX,^img\\d+\\.baidu\\.com$
+IP-CIDR,1.2.0.0/16,no-resolve
+10.8.0.0/16
+"""
+
+KEPT_RULES = [
+    ".onlymeta.com",
+    ".example.org",
+    "DOMAIN-KEYWORD,baidu",
+    "DOMAIN-REGEX,^img\\d+\\.baidu\\.com$",
+    "IP-CIDR,1.2.0.0/16,no-resolve",
+    "10.8.0.0/16"
+]
+
+def source(suffixes, domains=()):
+    return generate_pac.compact_rules({"suffixes": suffixes, "domains": domains})
+
+class CleanDirectTest(unittest.TestCase):
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp(prefix="clean-direct-test-")
+        self.direct_file = os.path.join(self.work_dir, "direct.txt")
+        with open(self.direct_file, "w", encoding="utf-8") as f:
+            f.write(MIXED_DIRECT)
+        self.sources = {
+            "localarea": source(["local", "lan"]),
+            "acl4ssr": source(["baidu.com", "qq.com"]),
+            "metacubex": source(["baidu.com", "qq.com", "onlymeta.com", "1.2.0.0"], ["www.baidu.com"])
+        }
+
+    def tearDown(self):
+        shutil.rmtree(self.work_dir, ignore_errors=True)
+
+    def test_mixed_syntax(self):
+        direct_domains, rules, comments = clean_direct_with_cnlist.read_direct_file(self.direct_file)
+        self.assertEqual(direct_domains["keywords"], ["baidu"])
+        self.assertEqual(direct_domains["regexes"], ["^img\\d+\\.baidu\\.com$"])
+        self.assertEqual(direct_domains["cidrs"], ["1.2.0.0/16", "10.8.0.0/16"])
+
+        duplicates, child_domains, clean_domains, covered, partial = clean_direct_with_cnlist.check_duplicate_domains(
+            self.sources, rules, ["metacubex", "acl4ssr"]
+        )
+        self.assertEqual(clean_domains, KEPT_RULES)
+        # www.baidu.com 是 metacubex 中的全字匹配规则，取最近的覆盖规则
+        self.assertEqual(duplicates, [".baidu.com", "www.baidu.com"])
+        self.assertEqual(child_domains, [("img.qq.com", "qq.com"), ("printer.local", "local")])
+        self.assertEqual([rule for rule, _ in partial], [".onlymeta.com"])
+        self.assertEqual(len(covered), 4)
+
+        self.assertTrue(clean_direct_with_cnlist.save_direct_file(clean_domains, comments, self.direct_file))
+        _, written, _ = clean_direct_with_cnlist.read_direct_file(self.direct_file)
+        self.assertEqual(written, KEPT_RULES)
+
+    def test_non_domain_rules_never_covered(self):
+        rules = ["DOMAIN-REGEX,^img\\d+\\.baidu.com", "DOMAIN-KEYWORD,baidu.com", "IP-CIDR,1.2.0.0/16", "1.2.0.0/16"]
+        self.assertEqual(clean_direct_with_cnlist.find_covering_rules(self.sources, rules), {})
+
+if __name__ == "__main__":
+    unittest.main()
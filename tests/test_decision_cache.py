@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+在 node 中运行生成的 PAC，校验 pac-template 中 FindProxyForURL 的判定缓存：
+同一组 host（数量远大于缓存容量，覆盖命中和淘汰）分别在小容量缓存和关闭缓存时判定，
+结果必须一致，且与 pac_engine.classify_host 一致；未安装 node 时跳过
+
+使用方法:
+    python3 -m unittest discover -s tests
+"""
+
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+import generate_pac
+import pac_engine
+
+PROXY = "PROXY proxy.test:1"
+DIRECT = "DIRECT"
+DEFAULT = "PROXY default.test:2"
+CACHE_SIZE = 16
+DISTINCT_HOSTS = 400
+LOOKUPS = 5000
+
+# 依次判定所有 host，输出每个结果以及结束时缓存表和淘汰队列的大小
+NODE_SCRIPT = """
+const fs = require("fs");
+const source = fs.readFileSync(process.argv[1], "utf8");
+const pac = new Function(source + "; return [FindProxyForURL, () => [Object.keys(decisionCache).length, decisionCacheKeys.length]];")();
+const hosts = JSON.parse(fs.readFileSync(process.argv[2], "utf8"));
+const results = hosts.map(host => pac[0]("https://" + host + "/", host));
+console.log(JSON.stringify({results: results, cache: pac[1]()}));
+"""
+
+def build_rule_sets():
+    """构造覆盖后缀、全字匹配、关键字、正则和 IP 段的规则集"""
+    direct = {
+        "suffixes": ["cn", "baidu.com", "qq.com", "example.org"],
+        "domains": ["exact.example.net"],
+        "cidrs": ["1.2.0.0/16"],
+        "keywords": ["taobao"],
+        "regexes": [r"^cdn\d+\.example\.com$"]
+    }
+    proxy = {
+        "suffixes": ["google.com", "mail.qq.com"],
+        "domains": ["proxy.example.org"],
+        "cidrs": ["8.8.8.0/24"],
+        "keywords": ["youtube"],
+        "regexes": []
+    }
+    return {"direct": generate_pac.compact_rules(direct), "proxy": generate_pac.compact_rules(proxy)}
+
+def build_hosts(seed=1):
+    """生成 LOOKUPS 次访问：DISTINCT_HOSTS 个 host 随机重复出现，部分使用大写，保证缓存既有命中也有淘汰"""
+    rng = random.Random(seed)
+    bases = ["baidu.com", "qq.com", "mail.qq.com", "google.com", "example.org", "proxy.example.org",
+             "exact.example.net", "example.net", "taobao.example.com", "youtube-nocookie.com", "gov.cn", "unknown.io"]
+    distinct = []
+    for i in range(DISTINCT_HOSTS):
+        kind = i % 4
+        if kind == 0:
+            distinct.append(f"h{i}.{rng.choice(bases)}")
+        elif kind == 1:
+            distinct.append(f"cdn{i}.example.com")
+        elif kind == 2:
+            distinct.append(f"{rng.choice([1, 8, 10, 192])}.{rng.choice([2, 8, 168])}.{rng.randrange(256)}.{rng.randrange(256)}")
+        else:
+            distinct.append(rng.choice(bases))
+    hosts = []
+    for _ in range(LOOKUPS):
+        host = rng.choice(distinct[:CACHE_SIZE * 2]) if rng.random() < 0.5 else rng.choice(distinct)
+        hosts.append(host.upper() if rng.random() < 0.1 else host)
+    return hosts
+
+@unittest.skipUnless(shutil.which("node"), "未安装 node")
+class DecisionCacheTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        with open(os.path.join(ROOT_DIR, generate_pac.PAC_TEMPLATE), "r", encoding="utf-8") as f:
+            cls.template = f.read()
+        cls.rule_sets = build_rule_sets()
+        cls.hosts = build_hosts()
+        cls.work_dir = tempfile.mkdtemp(prefix="pac-cache-test-")
+        cls.hosts_file = os.path.join(cls.work_dir, "hosts.json")
+        with open(cls.hosts_file, "w", encoding="utf-8") as f:
+            json.dump(cls.hosts, f)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.work_dir, ignore_errors=True)
+
+    def run_pac(self, cache_size, minify=False):
+        """渲染判定缓存容量为 cache_size 的 PAC 并在 node 中判定所有 host，返回 (结果列表, [缓存表大小, 淘汰队列大小])"""
+        options = {"decision_cache": cache_size, "minify": minify}
+        content = generate_pac.render_pac(self.template, self.rule_sets, PROXY, DIRECT, DEFAULT, options, report=False)
+        pac_file = os.path.join(self.work_dir, f"cache-{cache_size}-{int(minify)}.pac")
+        with open(pac_file, "w", encoding="utf-8") as f:
+            f.write(content)
+        result = subprocess.run([shutil.which("node"), "-e", NODE_SCRIPT, pac_file, self.hosts_file],
+                                capture_output=True, text=True)
+        self.assertEqual(result.returncode, 0, result.stderr)
+        output = json.loads(result.stdout)
+        return output["results"], output["cache"]
+
+    def test_cached_results_match_uncached(self):
+        uncached, uncached_state = self.run_pac(0)
+        self.assertEqual(uncached_state, [0, 0])
+        for minify in (False, True):
+            cached, (table_size, queue_size) = self.run_pac(CACHE_SIZE, minify)
+            mismatches = [(host, a, b) for host, a, b in zip(self.hosts, cached, uncached) if a != b]
+            self.assertEqual(mismatches, [])
+            # 访问的 host 种类远多于容量，缓存必须已满且没有超出容量
+            self.assertEqual(table_size, CACHE_SIZE)
+            self.assertEqual(queue_size, CACHE_SIZE)
+
+    def test_results_match_pac_engine(self):
+        uncached, _ = self.run_pac(0)
+        rules = pac_engine.compile_rules(self.rule_sets)
+        decisions = {pac_engine.DECISION_DIRECT: DIRECT, pac_engine.DECISION_PROXY: PROXY, pac_engine.DECISION_DEFAULT: DEFAULT}
+        expected = [decisions[pac_engine.classify_host(host, rules)] for host in self.hosts]
+        mismatches = [(host, a, b) for host, a, b in zip(self.hosts, uncached, expected) if a != b]
+        self.assertEqual(mismatches, [])
+        # 规则集应覆盖三种判定结果
+        self.assertEqual(set(uncached), {DIRECT, PROXY, DEFAULT})
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+校验 dnsmasq 导出不会把局域网域名转发给公共 DNS
+
+使用方法:
+    python3 -m unittest discover -s tests
+"""
+
+import contextlib
+import io
+import os
+import sys
+import unittest
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+import generate_pac
+
+LAN_SUFFIXES = ["local", "lan", "home.arpa", "localdomain"]
+LAN_DOMAINS = ["localhost"]
+
+def build_rule_sets():
+    """按生成流程合并局域网、中国域名列表和自定义规则"""
+    inputs = {
+        "localarea": generate_pac.compact_rules({"suffixes": LAN_SUFFIXES, "domains": LAN_DOMAINS, "cidrs": ["192.168.0.0/16"]}),
+        "china": {"metacubex": generate_pac.compact_rules({"suffixes": ["baidu.com", "qq.com"], "domains": ["router.lan"]})},
+        "custom_direct": generate_pac.compact_rules({"suffixes": ["nas.home.arpa", "example.cn"], "domains": ["printer.local"]}),
+        "proxy": generate_pac.compact_rules({"suffixes": ["google.com"]})
+    }
+    with contextlib.redirect_stdout(io.StringIO()):
+        return generate_pac.merge_rule_sets(inputs, "metacubex")
+
+def is_lan(domain):
+    return any(domain == lan or domain.endswith("." + lan) for lan in LAN_SUFFIXES + LAN_DOMAINS)
+
+class DnsmasqExportTest(unittest.TestCase):
+    def setUp(self):
+        target = generate_pac.make_target("metacubex", "proxy.pac")
+        content = generate_pac.render_dnsmasq_conf(build_rule_sets(), target, {})[".dnsmasq.conf"].decode("utf-8")
+        self.lines = content.splitlines()
+
+    def test_lan_suffixes_not_forwarded(self):
+        forwarded = [line.split("/")[1] for line in self.lines if line.startswith("server=")]
+        self.assertEqual([domain for domain in forwarded if is_lan(domain)], [])
+        self.assertIn(f"server=/baidu.com/{generate_pac.DNSMASQ_DIRECT_SERVER}", self.lines)
+        self.assertIn(f"server=/example.cn/{generate_pac.DNSMASQ_DIRECT_SERVER}", self.lines)
+        self.assertIn(f"server=/google.com/{generate_pac.DNSMASQ_PROXY_SERVER}", self.lines)
+
+    def test_lan_suffixes_answered_locally(self):
+        local = [line for line in self.lines if line.startswith("local=")]
+        self.assertEqual(local, [f"local=/{domain}/" for domain in sorted(LAN_SUFFIXES + LAN_DOMAINS)])
+
+if __name__ == "__main__":
+    unittest.main()
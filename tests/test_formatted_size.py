@@ -0,0 +1,38 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+校验 formatted_size 与平铺编码实际输出的长度一致，包括精简（--minify）时的分隔符
+
+使用方法:
+    python3 -m unittest discover -s tests
+"""
+
+import os
+import sys
+import unittest
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+import generate_pac
+
+RULE_SETS = [
+    {},
+    {"suffixes": ["cn"]},
+    {"suffixes": ["baidu.com", "qq.com", "mail.qq.com"], "domains": ["exact.example.net"]},
+    {"suffixes": [f"h{i}.example{i % 7}.com" for i in range(500)], "domains": ["a.b", "中文.cn"]}
+]
+
+class FormattedSizeTest(unittest.TestCase):
+    def test_matches_flat_rendering(self):
+        for rules in RULE_SETS:
+            domain_dict = generate_pac.compact_rules(rules)
+            for minify in (False, True):
+                with self.subTest(rules=sorted(rules), minify=minify):
+                    formatted = generate_pac.format_domain_lists_for_pac(domain_dict, encoding="flat", minify=minify)
+                    actual = sum(len(value.encode("utf-8")) for value in formatted.values())
+                    self.assertEqual(generate_pac.formatted_size(domain_dict, minify), actual)
+
+if __name__ == "__main__":
+    unittest.main()